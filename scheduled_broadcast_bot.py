@@ -1,17 +1,33 @@
 import asyncio
+import bisect
+import contextvars
+import glob
+import hashlib
+import heapq
 import json
 import logging
+import multiprocessing
 import os
 import random
-from datetime import datetime, time, timedelta
-from typing import List, Dict, Any
-from dotenv import load_dotenv
-import schedule
+import re
+import sqlite3
+import struct
 import threading
+import uuid
+from array import array
+from collections import Counter, deque
+from itertools import zip_longest
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time, timedelta, timezone
+from typing import List, Dict, Any, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from dotenv import load_dotenv
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton, InputMediaPhoto
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
+from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler, BaseRateLimiter, ExtBot
 from telegram.constants import ParseMode
+from telegram.request import HTTPXRequest
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError, TimedOut
 import telegram
 
 # Load environment variables
@@ -24,13 +40,2337 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Broadcast delivery settings
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '20'))
+MAX_CONCURRENT_CAMPAIGNS = int(os.getenv('MAX_CONCURRENT_CAMPAIGNS', '2'))
+# Scheduled broadcasts firing within this many seconds of each other are delivered
+# together in one pass over their subscribers (0 = each one on its own)
+CAMPAIGN_MERGE_SECONDS = float(os.getenv('CAMPAIGN_MERGE_SECONDS', '5'))
+BROADCAST_MAX_ATTEMPTS = int(os.getenv('BROADCAST_MAX_ATTEMPTS', '4'))
+
+# Broadcasts to at least SHARDED_MIN_SUBSCRIBERS chats are split over worker processes
+# when BROADCAST_WORKERS > 1 or extra bot tokens are configured (comma separated)
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', '1'))
+BROADCAST_WORKER_TOKENS = os.getenv('BROADCAST_WORKER_TOKENS', '')
+SHARDED_MIN_SUBSCRIBERS = int(os.getenv('SHARDED_MIN_SUBSCRIBERS', '10000'))
+
+# Broadcasts in a row a chat may run out of retries on before it is unsubscribed
+QUARANTINE_STRIKES = int(os.getenv('QUARANTINE_STRIKES', '3'))
+
+# Subscriber change-log entries written before subscribers.json is rewritten
+SUBSCRIBER_LOG_COMPACT_AFTER = int(os.getenv('SUBSCRIBER_LOG_COMPACT_AFTER', '1000'))
+
+# Seconds between batched writes of subscribers removed during a broadcast
+REMOVAL_FLUSH_INTERVAL = float(os.getenv('REMOVAL_FLUSH_INTERVAL', '30'))
+
+# Storage backend: "json" (flat files) or "sqlite"
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json').lower()
+SQLITE_DB_FILE = os.getenv('SQLITE_DB_FILE', 'broadcast_bot.db')
+
+# Progress checkpoints of running campaigns, used to resume them after a restart
+CAMPAIGN_DIR = os.getenv('CAMPAIGN_DIR', 'campaigns')
+
+# Per-chat delivery records of every campaign
+LEDGER_DIR = os.getenv('LEDGER_DIR', 'ledger')
+
+# Seconds between edits of an admin's broadcast progress message
+PROGRESS_UPDATE_INTERVAL = float(os.getenv('PROGRESS_UPDATE_INTERVAL', '3'))
+
+# One-time broadcasts missed while the bot was down are still sent if at most this late
+ONE_TIME_CATCHUP_MINUTES = float(os.getenv('ONE_TIME_CATCHUP_MINUTES', '60'))
+
+# What the scheduler does with a run missed while the bot was down or the event loop stalled:
+# fire_late sends it if at most MISFIRE_GRACE_MINUTES late, skip drops it, coalesce
+# sends it however late. Several missed runs of one job are only ever sent once.
+FIRE_LATE = 'fire_late'
+SKIP = 'skip'
+COALESCE = 'coalesce'
+MISFIRE_POLICY = os.getenv('MISFIRE_POLICY', FIRE_LATE).lower()
+MISFIRE_GRACE_MINUTES = float(os.getenv('MISFIRE_GRACE_MINUTES', '60'))
+
+# New daily broadcasts spread their delivery over this many minutes instead of sending
+# as fast as possible, so campaigns starting at the same time share the rate limit (0 = off)
+DELIVERY_WINDOW_MINUTES = float(os.getenv('DELIVERY_WINDOW_MINUTES', '0'))
+
+# Telegram Bot API limits (messages per second)
+GLOBAL_RATE_LIMIT = float(os.getenv('GLOBAL_RATE_LIMIT', '30'))
+CHAT_RATE_LIMIT = 1.0
+GROUP_RATE_LIMIT = 20 / 60
+
+# Priority of an outbound request, passed as rate_limit_args. Requests without one
+# (replies to commands and buttons) are interactive and go ahead of broadcast traffic.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """Get the flood-wait delay of a RetryAfter error in seconds"""
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+# CampaignJob of the campaign running in the current task, if any
+current_campaign_job = contextvars.ContextVar('current_campaign_job', default=None)
+
+# What a broadcast does with a chat after a failed send
+RETRY = 'retry'
+DROP = 'drop'
+QUARANTINE = 'quarantine'
+FAIL = 'fail'
+
+
+class DeliveryErrorClassifier:
+    """Decide what to do with a chat after a failed send, keyed on telegram.error types
+
+    Flood waits, timeouts and network errors are retried. Forbidden (bot blocked,
+    user deactivated) and "chat not found" drop the subscriber. A chat that runs
+    out of retries is quarantined instead of removed and only dropped after
+    failing that way in quarantine_strikes broadcasts in a row. Any other error
+    (bad Markdown, message too long) is a problem with the message, so the chat
+    is neither retried nor dropped.
+    """
+
+    NOT_FOUND_MARKERS = ("chat not found", "user not found", "peer_id_invalid", "chat_id is empty")
+
+    def __init__(self, quarantine_strikes: int = QUARANTINE_STRIKES):
+        self.quarantine_strikes = max(1, quarantine_strikes)
+        self.counters = Counter()
+        self.strikes = {}
+
+    def error_class(self, error: Exception) -> str:
+        """Name of the class an error belongs to"""
+        if isinstance(error, RetryAfter):
+            return 'retry_after'
+        if isinstance(error, Forbidden):
+            return 'forbidden'
+        # BadRequest and TimedOut are NetworkError subclasses, check them first
+        if isinstance(error, BadRequest):
+            message = error.message.lower()
+            if any(marker in message for marker in self.NOT_FOUND_MARKERS):
+                return 'chat_not_found'
+            return 'bad_request'
+        if isinstance(error, TimedOut):
+            return 'timed_out'
+        if isinstance(error, NetworkError):
+            return 'network'
+        return 'other'
+
+    def classify(self, error: Exception, attempt: int, max_attempts: int):
+        """Return (error_class, decision, retry_delay) for a failed send attempt"""
+        error_class = self.error_class(error)
+        self.counters[error_class] += 1
+
+        if error_class in ('forbidden', 'chat_not_found'):
+            return error_class, DROP, None
+        if error_class == 'retry_after':
+            # A flood wait is about the bot, not the chat, so it never counts against it
+            if attempt >= max_attempts:
+                return error_class, FAIL, None
+            return error_class, RETRY, retry_after_seconds(error)
+        if error_class in ('timed_out', 'network'):
+            if attempt >= max_attempts:
+                return error_class, QUARANTINE, None
+            return error_class, RETRY, 2 ** attempt + random.random()
+        return error_class, FAIL, None
+
+    def quarantine(self, chat_id: int) -> bool:
+        """Record a strike against a chat, returns True once it should be dropped"""
+        strikes = self.strikes.get(chat_id, 0) + 1
+        if strikes >= self.quarantine_strikes:
+            self.strikes.pop(chat_id, None)
+            return True
+        self.strikes[chat_id] = strikes
+        return False
+
+    def delivered(self, chat_id: int):
+        """A successful send lifts any quarantine"""
+        if self.strikes:
+            self.strikes.pop(chat_id, None)
+
+
+class TokenBucket:
+    """Token bucket that refills at a fixed rate up to a burst capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = None
+        self.lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        if self.updated is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def is_full(self, now: float) -> bool:
+        """Check if the bucket has refilled completely (safe to forget)"""
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        loop = asyncio.get_running_loop()
+        async with self.lock:
+            while True:
+                self._refill(loop.time())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class PriorityTokenBucket(TokenBucket):
+    """Token bucket that hands out tokens by priority, then in arrival order
+
+    Waiters sit in a heap and a single dispatcher task grants each refilled token
+    to the lowest priority value, so a request queued behind thousands of bulk sends
+    takes the next token instead of waiting for all of them.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        super().__init__(rate, capacity)
+        self.waiters = []
+        self.sequence = 0
+        self.dispatcher = None
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        """Wait until a token is granted to this request and take it"""
+        loop = asyncio.get_running_loop()
+        self._refill(loop.time())
+        if not self.waiters and self.tokens >= 1:
+            self.tokens -= 1
+            return
+        
+        future = loop.create_future()
+        self.sequence += 1
+        heapq.heappush(self.waiters, (priority, self.sequence, future))
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = asyncio.create_task(self._dispatch())
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as the caller gave up, hand the token back
+                self.tokens += 1
+            raise
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while self.waiters:
+            self._refill(loop.time())
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                self.tokens -= 1
+                future.set_result(None)
+
+
+class TelegramRateLimiter(BaseRateLimiter):
+    """Throttle every Bot API request with a global bucket plus per-chat and per-group buckets
+
+    All traffic shares the global bucket, which serves interactive requests before
+    those sent with rate_limit_args=PRIORITY_BULK.
+    """
+
+    def __init__(self, global_rate: float = GLOBAL_RATE_LIMIT, chat_rate: float = CHAT_RATE_LIMIT,
+                 group_rate: float = GROUP_RATE_LIMIT, max_chat_buckets: int = 10000):
+        self.global_bucket = PriorityTokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.max_chat_buckets = max_chat_buckets
+        self.chat_buckets = {}
+        self.paused_until = 0.0
+
+    def set_global_rate(self, rate: float):
+        """Change the global budget, e.g. while worker processes send with the same token"""
+        bucket = self.global_bucket
+        bucket.rate = bucket.capacity = rate
+        bucket.tokens = min(bucket.tokens, rate)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        self.chat_buckets.clear()
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= self.max_chat_buckets:
+                # Forget chats whose bucket is full again, they behave like new chats
+                now = asyncio.get_running_loop().time()
+                self.chat_buckets = {
+                    key: value for key, value in self.chat_buckets.items()
+                    if value.lock.locked() or not value.is_full(now)
+                }
+            # Groups/channels have negative ids (or @username) and a per-minute limit
+            if isinstance(chat_id, str) or chat_id < 0:
+                bucket = TokenBucket(self.group_rate, 20)
+            else:
+                bucket = TokenBucket(self.chat_rate, 3)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def pause(self, seconds: float):
+        """Hold back all requests for the given time (Telegram flood wait)"""
+        loop = asyncio.get_running_loop()
+        self.paused_until = max(self.paused_until, loop.time() + seconds)
+    
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        delay = self.paused_until - asyncio.get_running_loop().time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        
+        chat_id = data.get('chat_id')
+        if chat_id is not None:
+            await self._chat_bucket(chat_id).acquire()
+        priority = PRIORITY_INTERACTIVE if rate_limit_args is None else rate_limit_args
+        await self.global_bucket.acquire(priority)
+        
+        try:
+            return await callback(*args, **kwargs)
+        except RetryAfter as error:
+            # Flood control applies to the whole bot, so everyone waits it out
+            self.pause(retry_after_seconds(error))
+            raise
+
+
+class SubscriberStore:
+    """Subscriber set with O(1) membership, persisted as a snapshot plus an append-only change log"""
+
+    def __init__(self, snapshot_file: str, log_file: str, compact_after: int = SUBSCRIBER_LOG_COMPACT_AFTER):
+        self.snapshot_file = snapshot_file
+        self.log_file = log_file
+        self.compact_after = compact_after
+        self.index = {}  # chat_id -> None, a dict keeps join order
+        self.log_entries = 0
+        self.log_handle = None
+        self.load()
+
+    def load(self):
+        """Load the snapshot and replay the change log on top of it"""
+        try:
+            with open(self.snapshot_file, 'r') as f:
+                data = json.load(f)
+                self.index = dict.fromkeys(data.get('subscribers', []))
+        except FileNotFoundError:
+            self.index = {}
+        
+        try:
+            with open(self.log_file, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    # A crash can leave a partial last line behind
+                    if len(line) < 2 or line[0] not in '+-':
+                        continue
+                    try:
+                        chat_id = int(line[1:])
+                    except ValueError:
+                        continue
+                    if line[0] == '+':
+                        self.index[chat_id] = None
+                    else:
+                        self.index.pop(chat_id, None)
+                    self.log_entries += 1
+        except FileNotFoundError:
+            pass
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, chat_id) -> bool:
+        return chat_id in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def copy(self) -> List[int]:
+        """Snapshot of the current subscriber ids"""
+        return list(self.index)
+
+    def add(self, chat_id: int) -> bool:
+        """Add subscriber, returns False if already subscribed"""
+        if chat_id in self.index:
+            return False
+        self.index[chat_id] = None
+        self._append('+', chat_id)
+        return True
+
+    def remove(self, chat_id: int) -> bool:
+        """Remove subscriber, returns False if not subscribed"""
+        if chat_id not in self.index:
+            return False
+        del self.index[chat_id]
+        self._append('-', chat_id)
+        return True
+
+    def remove_many(self, chat_ids) -> int:
+        """Remove several subscribers with a single log write, returns how many were removed"""
+        removed = [chat_id for chat_id in chat_ids if self.index.pop(chat_id, False) is None]
+        if removed:
+            self._append_lines([f"-{chat_id}\n" for chat_id in removed])
+        return len(removed)
+
+    def _append(self, op: str, chat_id: int):
+        self._append_lines([f"{op}{chat_id}\n"])
+
+    def _append_lines(self, lines: List[str]):
+        if self.log_handle is None:
+            self.log_handle = open(self.log_file, 'a', buffering=1)
+        self.log_handle.write(''.join(lines))
+        self.log_entries += len(lines)
+        if self.log_entries >= self.compact_after:
+            self.compact()
+
+    def compact(self):
+        """Rewrite the snapshot with the current subscribers and truncate the change log"""
+        data = {
+            'subscribers': list(self.index),
+            'total_count': len(self.index),
+            'last_updated': datetime.now().isoformat()
+        }
+        temp_file = f"{self.snapshot_file}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp_file, self.snapshot_file)
+        
+        # Replaying the log again is harmless, so truncating after the replace is crash-safe
+        if self.log_handle is not None:
+            self.log_handle.close()
+        self.log_handle = open(self.log_file, 'w', buffering=1)
+        self.log_entries = 0
+
+
+class PendingRemovals:
+    """Collect subscriber removals during broadcasts and apply them in one batched write"""
+
+    def __init__(self, subscribers, journal_file: str, flush_interval: float = REMOVAL_FLUSH_INTERVAL):
+        self.subscribers = subscribers
+        self.journal_file = journal_file
+        self.flush_interval = flush_interval
+        self.pending = set()
+        self.journal_handle = None
+        self.last_flush = datetime.now()
+        self.replay()
+
+    def replay(self):
+        """Apply removals journaled before a crash"""
+        try:
+            with open(self.journal_file, 'r') as f:
+                chat_ids = [int(line) for line in f if line.strip().lstrip('-').isdigit()]
+        except FileNotFoundError:
+            return
+        if chat_ids:
+            self.pending.update(chat_ids)
+            logger.info(f"Replaying {len(chat_ids)} journaled subscriber removals")
+        self.flush()
+
+    def add(self, chat_id: int) -> bool:
+        """Queue a subscriber for removal, returns False if already queued or not subscribed"""
+        if chat_id in self.pending or chat_id not in self.subscribers:
+            return False
+        self.pending.add(chat_id)
+        if self.journal_handle is None:
+            self.journal_handle = open(self.journal_file, 'a', buffering=1)
+        self.journal_handle.write(f"{chat_id}\n")
+        if (datetime.now() - self.last_flush).total_seconds() >= self.flush_interval:
+            self.flush()
+        return True
+
+    def discard(self, chat_id: int) -> bool:
+        """Cancel a queued removal, for a chat that subscribed again before the flush"""
+        if chat_id not in self.pending:
+            return False
+        self.pending.discard(chat_id)
+        # Rewrite the journal so a replay after a crash doesn't remove the chat either
+        if self.journal_handle is not None:
+            self.journal_handle.close()
+            self.journal_handle = None
+        temp_file = f"{self.journal_file}.tmp"
+        with open(temp_file, 'w') as f:
+            f.writelines(f"{pending_id}\n" for pending_id in self.pending)
+        os.replace(temp_file, self.journal_file)
+        return True
+
+    def flush(self) -> int:
+        """Remove all queued subscribers in one write and clear the journal"""
+        self.last_flush = datetime.now()
+        removed = 0
+        if self.pending:
+            removed = self.subscribers.remove_many(self.pending)
+            logger.info(f"Removed {removed} unreachable subscribers")
+            self.pending.clear()
+        if self.journal_handle is not None:
+            self.journal_handle.close()
+            self.journal_handle = None
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        return removed
+
+
+def one_time_to_json(entry: Dict) -> Dict:
+    """Make a one-time broadcast JSON serializable"""
+    return {**entry, 'datetime': entry['datetime'].isoformat()}
+
+
+def one_time_from_json(data: Dict) -> Dict:
+    """Inverse of one_time_to_json, the datetime is naive UTC"""
+    return {**data, 'datetime': datetime.fromisoformat(data['datetime']), 'status': data.get('status', 'pending')}
+
+
+class JsonStorage:
+    """Flat file storage: subscribers.json with its change log and scheduled_messages.json"""
+
+    def __init__(self, subscribers_file: str, subscribers_log_file: str, messages_file: str, history_file: str,
+                 one_time_file: str, timezones_file: str):
+        self.subscribers_file = subscribers_file
+        self.subscribers_log_file = subscribers_log_file
+        self.messages_file = messages_file
+        self.history_file = history_file
+        self.one_time_file = one_time_file
+        self.timezones_file = timezones_file
+        self.one_time_entries = {}  # id -> pending one-time broadcast
+        self.timezones = {}  # chat_id -> timezone name
+
+    def open_subscribers(self) -> SubscriberStore:
+        """Open the subscriber store"""
+        return SubscriberStore(self.subscribers_file, self.subscribers_log_file)
+
+    def load_scheduled_messages(self) -> Optional[List[Dict]]:
+        """Load scheduled messages, None if nothing was saved yet"""
+        try:
+            with open(self.messages_file, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save_scheduled_messages(self, messages: List[Dict]):
+        """Save scheduled messages"""
+        with open(self.messages_file, 'w') as f:
+            json.dump(messages, f, indent=2)
+
+    def load_one_time_broadcasts(self) -> List[Dict]:
+        """Load one-time broadcasts that have not fired yet"""
+        try:
+            with open(self.one_time_file, 'r') as f:
+                entries = [one_time_from_json(data) for data in json.load(f)]
+        except FileNotFoundError:
+            entries = []
+        self.one_time_entries = {entry['id']: entry for entry in entries if entry['status'] == 'pending'}
+        return list(self.one_time_entries.values())
+
+    def save_one_time_broadcast(self, entry: Dict):
+        """Store a one-time broadcast, only pending ones are kept in the file"""
+        if entry['status'] == 'pending':
+            self.one_time_entries[entry['id']] = entry
+        else:
+            self.one_time_entries.pop(entry['id'], None)
+        temp_file = f"{self.one_time_file}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump([one_time_to_json(item) for item in self.one_time_entries.values()], f, indent=2)
+        os.replace(temp_file, self.one_time_file)
+
+    def load_subscriber_timezones(self) -> Dict[int, str]:
+        """Load the timezones subscribers picked for local-time delivery"""
+        try:
+            with open(self.timezones_file, 'r') as f:
+                self.timezones = {int(chat_id): zone for chat_id, zone in json.load(f).items()}
+        except FileNotFoundError:
+            self.timezones = {}
+        return dict(self.timezones)
+
+    def save_subscriber_timezone(self, chat_id: int, zone: Optional[str]):
+        """Store a subscriber's timezone, None forgets it"""
+        if zone is None:
+            self.timezones.pop(chat_id, None)
+        else:
+            self.timezones[chat_id] = zone
+        temp_file = f"{self.timezones_file}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump({str(chat_id): zone for chat_id, zone in self.timezones.items()}, f, indent=2)
+        os.replace(temp_file, self.timezones_file)
+
+    def record_broadcast(self, label: str, results: Dict[str, int]):
+        """Append the outcome of a finished broadcast to the delivery history"""
+        entry = {'label': label, 'sent_at': datetime.now().isoformat(), **results}
+        with open(self.history_file, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+class SQLiteSubscriberStore:
+    """Subscriber store backed by the subscribers table, same interface as SubscriberStore"""
+
+    def __init__(self, storage: 'SQLiteStorage'):
+        self.storage = storage
+        self.count = storage.query_one("SELECT COUNT(*) FROM subscribers")[0]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, chat_id) -> bool:
+        return self.storage.query_one("SELECT 1 FROM subscribers WHERE chat_id = ?", (chat_id,)) is not None
+
+    def __iter__(self):
+        return iter(self.copy())
+
+    def copy(self) -> List[int]:
+        """Snapshot of the current subscriber ids"""
+        rows = self.storage.query_all("SELECT chat_id FROM subscribers ORDER BY rowid")
+        return [row[0] for row in rows]
+
+    def add(self, chat_id: int) -> bool:
+        """Add subscriber, returns False if already subscribed"""
+        added = self.storage.execute(
+            "INSERT OR IGNORE INTO subscribers (chat_id, joined_at) VALUES (?, ?)",
+            (chat_id, datetime.now().isoformat())
+        ) > 0
+        if added:
+            self.count += 1
+        return added
+
+    def remove(self, chat_id: int) -> bool:
+        """Remove subscriber, returns False if not subscribed"""
+        removed = self.storage.execute("DELETE FROM subscribers WHERE chat_id = ?", (chat_id,)) > 0
+        if removed:
+            self.count -= 1
+        return removed
+
+    def remove_many(self, chat_ids) -> int:
+        """Remove several subscribers in one transaction, returns how many were removed"""
+        removed = self.storage.execute_many("DELETE FROM subscribers WHERE chat_id = ?", [(chat_id,) for chat_id in chat_ids])
+        self.count -= removed
+        return removed
+
+    def compact(self):
+        """Fold the write-ahead log back into the database file"""
+        self.storage.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+class SQLiteStorage:
+    """SQLite storage (WAL mode) for subscribers, scheduled messages and delivery history"""
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        # Every statement and every BEGIN...COMMIT runs under this lock, so nothing else on the
+        # shared connection lands inside an open transaction. All callers are synchronous code on
+        # the event loop thread today, the lock only matters if the connection is used off the loop.
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS subscribers (
+                chat_id INTEGER PRIMARY KEY,
+                joined_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS scheduled_messages (
+                id INTEGER PRIMARY KEY,
+                position INTEGER NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS one_time_broadcasts (
+                id INTEGER PRIMARY KEY,
+                due_at TEXT NOT NULL,
+                status TEXT NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS one_time_pending ON one_time_broadcasts (status, due_at);
+            CREATE TABLE IF NOT EXISTS subscriber_timezones (
+                chat_id INTEGER PRIMARY KEY,
+                timezone TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS broadcast_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                label TEXT,
+                sent_at TEXT,
+                success INTEGER,
+                failed INTEGER,
+                blocked_removed INTEGER,
+                retried INTEGER
+            );
+        """)
+        self.saved_messages = {}  # id -> (position, json) as last written
+
+    def execute(self, sql: str, params=()) -> int:
+        """Run one write statement, returns the number of changed rows"""
+        with self.lock:
+            return self.conn.execute(sql, params).rowcount
+
+    def execute_many(self, sql: str, rows: list) -> int:
+        """Run one write statement for every row in a single transaction"""
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                changed = self.conn.executemany(sql, rows).rowcount
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            return changed
+
+    def query_one(self, sql: str, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchone()
+
+    def query_all(self, sql: str, params=()) -> list:
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def import_json(self, subscribers_file: str, subscribers_log_file: str, messages_file: str, one_time_file: str,
+                    timezones_file: str):
+        """One-shot import of the existing JSON files into an empty database"""
+        if self.query_one("SELECT value FROM meta WHERE key = 'json_imported'"):
+            return
+        
+        subscribers = SubscriberStore(subscribers_file, subscribers_log_file).copy()
+        try:
+            with open(messages_file, 'r') as f:
+                messages = json.load(f)
+        except FileNotFoundError:
+            messages = None
+        try:
+            with open(one_time_file, 'r') as f:
+                one_time = json.load(f)
+        except FileNotFoundError:
+            one_time = []
+        try:
+            with open(timezones_file, 'r') as f:
+                timezones = json.load(f)
+        except FileNotFoundError:
+            timezones = {}
+        
+        now = datetime.now().isoformat()
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO subscribers (chat_id, joined_at) VALUES (?, ?)",
+                    ((chat_id, now) for chat_id in subscribers)
+                )
+                for position, msg in enumerate(messages or []):
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO scheduled_messages (id, position, data) VALUES (?, ?, ?)",
+                        (msg['id'], position, json.dumps(msg))
+                    )
+                for data in one_time:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO one_time_broadcasts (id, due_at, status, data) VALUES (?, ?, ?, ?)",
+                        (data['id'], data['datetime'], data.get('status', 'pending'), json.dumps(data))
+                    )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO subscriber_timezones (chat_id, timezone) VALUES (?, ?)",
+                    ((int(chat_id), zone) for chat_id, zone in timezones.items())
+                )
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_imported', ?)", (now,))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        logger.info(f"Imported {len(subscribers)} subscribers and {len(messages or [])} schedules into {self.db_file}")
+
+    def open_subscribers(self) -> SQLiteSubscriberStore:
+        """Open the subscriber store"""
+        return SQLiteSubscriberStore(self)
+
+    def load_scheduled_messages(self) -> Optional[List[Dict]]:
+        """Load scheduled messages, None if nothing was saved yet"""
+        rows = self.query_all("SELECT id, position, data FROM scheduled_messages ORDER BY position")
+        if not rows and not self.query_one("SELECT value FROM meta WHERE key = 'messages_saved'"):
+            return None
+        self.saved_messages = {row[0]: (row[1], row[2]) for row in rows}
+        return [json.loads(row[2]) for row in rows]
+
+    def save_scheduled_messages(self, messages: List[Dict]):
+        """Save scheduled messages, writing only the rows that changed"""
+        current = {msg['id']: (position, json.dumps(msg)) for position, msg in enumerate(messages)}
+        changed = [(msg_id, position, data) for msg_id, (position, data) in current.items()
+                   if self.saved_messages.get(msg_id) != (position, data)]
+        deleted = [(msg_id,) for msg_id in self.saved_messages if msg_id not in current]
+        
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO scheduled_messages (id, position, data) VALUES (?, ?, ?)", changed
+                )
+                self.conn.executemany("DELETE FROM scheduled_messages WHERE id = ?", deleted)
+                self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('messages_saved', '1')")
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        self.saved_messages = current
+
+    def load_one_time_broadcasts(self) -> List[Dict]:
+        """Load one-time broadcasts that have not fired yet"""
+        rows = self.query_all("SELECT data FROM one_time_broadcasts WHERE status = 'pending' ORDER BY due_at")
+        return [one_time_from_json(json.loads(row[0])) for row in rows]
+
+    def save_one_time_broadcast(self, entry: Dict):
+        """Store a one-time broadcast"""
+        data = one_time_to_json(entry)
+        self.execute(
+            "INSERT OR REPLACE INTO one_time_broadcasts (id, due_at, status, data) VALUES (?, ?, ?, ?)",
+            (entry['id'], data['datetime'], entry['status'], json.dumps(data))
+        )
+
+    def load_subscriber_timezones(self) -> Dict[int, str]:
+        """Load the timezones subscribers picked for local-time delivery"""
+        return dict(self.query_all("SELECT chat_id, timezone FROM subscriber_timezones"))
+
+    def save_subscriber_timezone(self, chat_id: int, zone: Optional[str]):
+        """Store a subscriber's timezone, None forgets it"""
+        if zone is None:
+            self.execute("DELETE FROM subscriber_timezones WHERE chat_id = ?", (chat_id,))
+        else:
+            self.execute("INSERT OR REPLACE INTO subscriber_timezones (chat_id, timezone) VALUES (?, ?)", (chat_id, zone))
+
+    def record_broadcast(self, label: str, results: Dict[str, int]):
+        """Append the outcome of a finished broadcast to the delivery history"""
+        self.execute(
+            "INSERT INTO broadcast_history (label, sent_at, success, failed, blocked_removed, retried) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (label, datetime.now().isoformat(), results.get('success', 0), results.get('failed', 0),
+             results.get('blocked_removed', 0), results.get('retried', 0))
+        )
+
+
+class OneTimeBroadcastQueue:
+    """Durable one-time broadcasts kept in send-time order"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.entries = sorted(storage.load_one_time_broadcasts(), key=lambda entry: entry['datetime'])
+        self.last_id = max((entry['id'] for entry in self.entries), default=0)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(list(self.entries))
+
+    def add(self, entry: Dict) -> Dict:
+        """Store a new pending broadcast, entry['datetime'] is naive UTC"""
+        # Millisecond timestamps keep ids unique across restarts
+        self.last_id = max(self.last_id + 1, int(datetime.now().timestamp() * 1000))
+        entry = {**entry, 'id': self.last_id, 'status': 'pending'}
+        bisect.insort(self.entries, entry, key=lambda item: item['datetime'])
+        self.storage.save_one_time_broadcast(entry)
+        return entry
+
+    def mark(self, entry: Dict, status: str):
+        """Take a broadcast off the queue as 'fired' or 'missed' and persist that"""
+        if entry in self.entries:
+            self.entries.remove(entry)
+        entry['status'] = status
+        self.storage.save_one_time_broadcast(entry)
+
+
+class MediaCache:
+    """Remember the Telegram file_id of uploaded files so each file is uploaded only once"""
+
+    def __init__(self, cache_file: str):
+        self.cache_file = cache_file
+        self.file_ids = self.load()
+        self.digests = {}  # path -> (mtime, size, sha256)
+        self.locks = {}
+
+    def load(self) -> Dict[str, str]:
+        """Load cached file_ids from file"""
+        if self.cache_file is None:
+            return {}
+        try:
+            with open(self.cache_file, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save(self):
+        """Save cached file_ids to file"""
+        if self.cache_file is None:
+            return
+        with open(self.cache_file, 'w') as f:
+            json.dump(self.file_ids, f, indent=2)
+
+    def key(self, path: str) -> str:
+        """Cache key made of the path and a hash of the file content"""
+        path = os.path.normpath(path)
+        stat = os.stat(path)
+        cached = self.digests.get(path)
+        if cached and cached[:2] == (stat.st_mtime, stat.st_size):
+            digest = cached[2]
+        else:
+            sha = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(65536), b''):
+                    sha.update(chunk)
+            digest = sha.hexdigest()
+            self.digests[path] = (stat.st_mtime, stat.st_size, digest)
+        return f"{path}:{digest}"
+
+    async def send(self, path: str, send_photo):
+        """Call send_photo(photo) with a cached file_id, uploading path only the first time"""
+        key = self.key(path)
+        file_id = self.file_ids.get(key)
+        if file_id:
+            try:
+                return await send_photo(file_id)
+            except BadRequest as e:
+                if "file" not in str(e).lower():
+                    raise
+                # Telegram no longer knows this file_id, upload it again
+                logger.warning(f"Cached file_id for {path} rejected: {e}")
+                self.file_ids.pop(key, None)
+        
+        # Only one upload per file, concurrent senders wait for its file_id
+        lock = self.locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            file_id = self.file_ids.get(key)
+            if file_id:
+                return await send_photo(file_id)
+            with open(path, 'rb') as photo:
+                message = await send_photo(photo)
+            if getattr(message, 'photo', None):
+                self.file_ids[key] = message.photo[-1].file_id
+                self.save()
+            return message
+
+
+class BroadcastFormatError(Exception):
+    """Telegram rejected a broadcast's Markdown, the campaign is stopped before anything goes out"""
+
+
+class CompiledBroadcast:
+    """A broadcast message prepared once and sent to every chat with only chat_id changing
+
+    The keyboard is serialized to JSON up front and handed to the Bot API as-is. The
+    first delivery is a probe: sends wait for it, Telegram's own parser checks the
+    Markdown (if it is rejected the campaign stops with a BroadcastFormatError rather
+    than going out as raw text) and an image is uploaded or resolved to a file_id that
+    all later sends reuse.
+    """
+
+    def __init__(self, bot, text: str, reply_markup=None, image: str = None, media_cache: MediaCache = None):
+        self.bot = bot
+        self.text = text
+        self.parse_mode = ParseMode.MARKDOWN
+        if isinstance(reply_markup, InlineKeyboardMarkup):
+            reply_markup = json.dumps(reply_markup.to_dict())
+        self.reply_markup = reply_markup
+        # String values in api_kwargs go to Telegram unchanged
+        self.api_kwargs = {'reply_markup': reply_markup} if reply_markup else None
+        self.image = image if image and os.path.exists(image) else None
+        self.media_cache = media_cache or MediaCache(None)
+        self.photo = None
+        self.ready = False
+        self.format_error = None
+        self.lock = asyncio.Lock()
+
+    async def send(self, chat_id):
+        """Deliver the broadcast to one chat"""
+        if not self.ready:
+            async with self.lock:
+                if self.format_error:
+                    raise self.format_error
+                if not self.ready:
+                    message = await self.probe(chat_id)
+                    self.ready = True
+                    return message
+        return await self.post(chat_id)
+
+    async def probe(self, chat_id):
+        try:
+            return await self.post(chat_id)
+        except BadRequest as e:
+            if "can't parse entities" not in e.message.lower():
+                raise
+            logger.warning(f"Broadcast Markdown rejected ({e.message}), not sending it")
+            self.format_error = BroadcastFormatError(e.message)
+            raise self.format_error
+
+    async def post(self, chat_id):
+        if not self.image:
+            return await self.bot.send_message(
+                chat_id=chat_id,
+                text=self.text,
+                parse_mode=self.parse_mode,
+                api_kwargs=self.api_kwargs,
+                rate_limit_args=PRIORITY_BULK
+            )
+        if self.photo:
+            return await self.bot.send_photo(
+                chat_id=chat_id,
+                photo=self.photo,
+                caption=self.text,
+                parse_mode=self.parse_mode,
+                api_kwargs=self.api_kwargs,
+                rate_limit_args=PRIORITY_BULK
+            )
+        message = await self.media_cache.send(
+            self.image,
+            lambda photo: self.bot.send_photo(
+                chat_id=chat_id,
+                photo=photo,
+                caption=self.text,
+                parse_mode=self.parse_mode,
+                api_kwargs=self.api_kwargs,
+                rate_limit_args=PRIORITY_BULK
+            )
+        )
+        if getattr(message, 'photo', None):
+            self.photo = message.photo[-1].file_id
+        return message
+
+
+WEEKDAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+MONTHS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+
+
+def resolve_timezone(name: Optional[str]):
+    """tzinfo for an IANA zone name or a fixed UTC[+/-H[:MM]] offset, None for server local time"""
+    if not name:
+        return None
+    upper = name.upper()
+    if upper.startswith('UTC'):
+        offset = upper[3:]
+        if not offset:
+            return timezone.utc
+        if offset[0] not in '+-':
+            raise ValueError(f"Invalid UTC offset: {name}")
+        hours, colon, minutes = offset[1:].partition(':')
+        if (not hours.isdigit() or len(hours) > 2 or (colon and (not minutes.isdigit() or len(minutes) != 2))
+                or int(minutes or 0) >= 60):
+            raise ValueError(f"Invalid UTC offset: {name}")
+        delta = timedelta(hours=int(hours), minutes=int(minutes or 0))
+        if delta > timedelta(hours=14):
+            raise ValueError(f"Invalid UTC offset: {name}")
+        return timezone(-delta if offset[0] == '-' else delta)
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone: {name}")
+
+
+def canonical_timezone(name: str) -> str:
+    """The one spelling a zone is stored and bucketed under: its IANA key, UTC or UTC+HH:MM"""
+    tz = resolve_timezone(name)
+    if tz is None:
+        raise ValueError("Expected a timezone")
+    if isinstance(tz, ZoneInfo):
+        return tz.key
+    offset = tz.utcoffset(None)
+    if not offset:
+        return 'UTC'
+    minutes = abs(offset) // timedelta(minutes=1)
+    return f"UTC{'-' if offset < timedelta(0) else '+'}{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class Recurrence:
+    """When a schedule fires: a cron-style rule evaluated in a timezone
+
+    Specs are "HH:MM" (daily, several comma separated), "mon,fri HH:MM" or
+    "mon-fri HH:MM" (weekly, day names only), "monthly 1,15 HH:MM" or five-field cron
+    "minute hour day month weekday". The fire times of a day are precomputed as a
+    sorted list of minutes, so finding the next one is a bisect. Wall times follow
+    the zone's DST rules: a time skipped by the clock change fires just after it,
+    a time that occurs twice fires once.
+    """
+
+    def __init__(self, spec: str, tz_name: str = None):
+        self.spec = ' '.join(spec.lower().split())
+        self.tz_name = tz_name
+        self.tz = resolve_timezone(tz_name)
+        self.months = None  # None matches any
+        self.days = None
+        self.weekdays = None  # Monday is 0
+        self.minutes = self.parse(self.spec.split())
+        if not self.minutes:
+            raise ValueError(f"No fire times in {spec!r}")
+
+    def __str__(self):
+        return f"{self.spec} ({self.tz_name or 'server time'})"
+
+    def parse(self, fields: List[str]) -> List[int]:
+        if len(fields) == 5:
+            minute, hour, day, month, weekday = fields
+            hours = self.cron_field(hour, 0, 23)
+            if hours is None:
+                hours = range(24)
+            minutes = self.cron_field(minute, 0, 59)
+            if minutes is None:
+                minutes = range(60)
+            self.days = self.cron_field(day, 1, 31)
+            self.months = self.cron_field(month, 1, 12, MONTHS, 1)
+            self.weekdays = self.weekday_field(weekday)
+            return sorted(hour * 60 + minute for hour in hours for minute in minutes)
+        
+        if not fields or len(fields) > 3:
+            raise ValueError(f"Invalid schedule: {' '.join(fields)}")
+        *prefix, times = fields
+        if prefix[:1] == ['daily']:
+            prefix = prefix[1:]
+        elif prefix[:1] == ['monthly']:
+            if len(prefix) != 2:
+                raise ValueError("Monthly schedules need days of the month, e.g. monthly 1,15 09:00")
+            self.days = self.cron_field(prefix[1], 1, 31)
+            prefix = []
+        elif prefix[:1] == ['weekly']:
+            prefix = prefix[1:]
+        if len(prefix) > 1:
+            raise ValueError(f"Invalid schedule: {' '.join(fields)}")
+        if prefix:
+            # Numbers are ambiguous (cron starts the week on Sunday), the cron form takes them
+            if any(char.isdigit() for char in prefix[0]):
+                raise ValueError(f"Use day names such as mon-fri, or the five-field cron form for numbers: {prefix[0]}")
+            self.weekdays = self.weekday_field(prefix[0])
+        return sorted({self.parse_time(value) for value in times.split(',')})
+
+    @classmethod
+    def weekday_field(cls, text: str) -> Optional[set]:
+        """Weekdays of a day-of-week field as weekday() values, None for any
+
+        Numbers count like cron, from Sunday, which is both 0 and 7.
+        """
+        # A range may end on Sunday (sat-sun), which cron writes as 7
+        weekdays = cls.cron_field(re.sub(r'-sun\b', '-7', text), 0, 7, ['sun'] + WEEKDAYS[:6])
+        if weekdays is None:
+            return None
+        return {(day - 1) % 7 for day in weekdays}
+
+    @staticmethod
+    def parse_time(value: str) -> int:
+        hour, _, minute = value.partition(':')
+        if not (len(hour) == len(minute) == 2 and hour.isdigit() and minute.isdigit()
+                and int(hour) <= 23 and int(minute) <= 59):
+            raise ValueError(f"Invalid time: {value}, expected HH:MM")
+        return int(hour) * 60 + int(minute)
+
+    @staticmethod
+    def cron_field(text: str, low: int, high: int, names: List[str] = None, first: int = 0) -> Optional[List[int]]:
+        """Values of one cron field ('*', 'a-b', '*/n', 'a,b', names), None for any"""
+        if text == '*':
+            return None
+        
+        def value(token):
+            if names and token in names:
+                return names.index(token) + first
+            if not token.isdigit():
+                raise ValueError(f"Invalid value: {token}")
+            number = int(token)
+            if not low <= number <= high:
+                raise ValueError(f"{number} is out of range {low}-{high}")
+            return number
+        
+        values = set()
+        for part in text.split(','):
+            part, slash, step = part.partition('/')
+            if slash and (not step.isdigit() or int(step) == 0):
+                raise ValueError(f"Invalid step: {part}/{step}")
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start, end = map(value, part.split('-', 1))
+                if start > end:
+                    raise ValueError(f"Reversed range: {part}")
+            else:
+                start = end = value(part)
+                if step:
+                    end = high
+            values.update(range(start, end + 1, int(step or 1)))
+        if not values:
+            raise ValueError(f"No values in {text}")
+        return sorted(values)
+
+    def matches(self, day) -> bool:
+        if self.months is not None and day.month not in self.months:
+            return False
+        if self.days is not None and self.weekdays is not None:
+            # Like cron, restricting both means either one will do
+            return day.day in self.days or day.weekday() in self.weekdays
+        if self.days is not None:
+            return day.day in self.days
+        if self.weekdays is not None:
+            return day.weekday() in self.weekdays
+        return True
+
+    def localize(self, naive: datetime) -> datetime:
+        if self.tz is None:
+            return naive.astimezone()
+        return naive.replace(tzinfo=self.tz)
+
+    def next_after(self, after: datetime) -> Optional[datetime]:
+        """First fire time strictly after the given moment, in UTC, None if it never fires again"""
+        local = after.astimezone(self.tz)
+        day = local.date()
+        start = bisect.bisect_right(self.minutes, local.hour * 60 + local.minute)
+        # Five years covers any rule that fires at all (29 February included)
+        for _ in range(366 * 5):
+            if self.matches(day):
+                for minute in self.minutes[start:]:
+                    run = self.localize(datetime.combine(day, time(minute // 60, minute % 60)))
+                    if run > after:
+                        return run.astimezone(timezone.utc)
+            day += timedelta(days=1)
+            start = 0
+        return None
+
+    @property
+    def is_daily(self) -> bool:
+        return self.months is None and self.days is None and self.weekdays is None
+
+    @property
+    def label(self) -> str:
+        """Rule and zone for display, with no characters Markdown would take as formatting"""
+        zone = (self.tz_name or 'server time').replace('_', ' ')
+        return f"{zone} {self.spec.replace('*', '∗')}"
+
+
+SCHEDULE_FORMAT_HELP = (
+    "Please use: <timezone> <schedule>\n\n"
+    "Examples:\n"
+    "• UTC+5:30 19:48\n"
+    "• Asia/Kolkata 19:48\n"
+    "• Europe/Berlin mon-fri 09:00\n"
+    "• America/New_York monthly 1,15 10:00\n"
+    "• UTC 30 9 * * 1-5 (cron)"
+)
+
+
+def parse_schedule_input(text: str) -> Recurrence:
+    """Parse an admin's "<timezone> <schedule>", e.g. "UTC+5:30 19:48" or "Europe/Berlin mon-fri 09:00" """
+    zone, _, spec = text.strip().partition(' ')
+    if not spec:
+        raise ValueError("Expected a timezone followed by a schedule")
+    return Recurrence(spec, canonical_timezone(zone))
+
+
+class ScheduledJob:
+    """A job of the AsyncScheduler, next_fire(after) gives its following run time or None when done"""
+
+    def __init__(self, next_fire, callback, args: tuple, name: str = "", policy: str = None, grace: float = None,
+                 on_skip=None):
+        self.next_fire = next_fire
+        self.callback = callback
+        self.args = args
+        self.name = name or getattr(callback, '__name__', 'job')
+        # Misfire policy and grace seconds, None uses the scheduler's
+        self.policy = policy
+        self.grace = grace
+        # Called with the job's args instead of the callback when the misfire policy skips a run
+        self.on_skip = on_skip
+        self.next_run = None
+        self.cancelled = False
+
+
+class AsyncScheduler:
+    """Run jobs on the event loop, sleeping exactly until the next one is due
+
+    A run found more than misfire_after seconds overdue (the bot was down, the loop
+    was blocked, the clock jumped) is a misfire and handled by the job's policy.
+    """
+
+    def __init__(self, max_sleep: float = 60, policy: str = MISFIRE_POLICY,
+                 grace: float = MISFIRE_GRACE_MINUTES * 60, misfire_after: float = 30):
+        self.heap = []  # (next_run, seq, job)
+        self.seq = 0
+        # Upper bound on a single sleep so wall-clock jumps are noticed
+        self.max_sleep = max_sleep
+        if policy not in (FIRE_LATE, SKIP, COALESCE):
+            logger.warning(f"Unknown MISFIRE_POLICY {policy!r}, using {FIRE_LATE}")
+            policy = FIRE_LATE
+        self.policy = policy
+        self.grace = grace
+        self.misfire_after = misfire_after
+        self.wakeup = None
+        self.runner = None
+        self.tasks = set()
+
+    def add_job(self, next_fire, callback, *args, name: str = "", last_run: datetime = None) -> ScheduledJob:
+        """Schedule callback(*args) at the times produced by next_fire
+
+        Given the time the job last ran, runs missed since then are due right away
+        and go through the misfire policy.
+        """
+        job = ScheduledJob(next_fire, callback, args, name)
+        job.next_run = next_fire(last_run or datetime.now(timezone.utc))
+        self._push(job)
+        return job
+
+    def recurring(self, recurrence: Recurrence, callback, *args, name: str = "", last_run: datetime = None) -> ScheduledJob:
+        """Run callback at every fire time of a Recurrence"""
+        return self.add_job(recurrence.next_after, callback, *args, name=name, last_run=last_run)
+
+    def at(self, when: datetime, callback, *args, name: str = "", policy: str = None,
+           grace: float = None, on_skip=None) -> ScheduledJob:
+        """Run callback once at the given moment, right away if it already passed"""
+        job = ScheduledJob(lambda after: None, callback, args, name, policy, grace, on_skip)
+        job.next_run = when
+        self._push(job)
+        return job
+
+    def next_run(self) -> Optional[datetime]:
+        """When the next job is due, None if nothing is scheduled"""
+        return self.heap[0][0] if self.heap else None
+
+    def cancel(self, job: ScheduledJob):
+        """Stop a job from firing again and drop it from the queue"""
+        job.cancelled = True
+        self.heap = [entry for entry in self.heap if entry[2] is not job]
+        heapq.heapify(self.heap)
+
+    def _push(self, job: ScheduledJob):
+        if job.next_run is None or job.cancelled:
+            return
+        self.seq += 1
+        heapq.heappush(self.heap, (job.next_run, self.seq, job))
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def start(self):
+        """Start the scheduler loop on the running event loop"""
+        self.wakeup = asyncio.Event()
+        self.runner = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop the scheduler loop"""
+        if self.runner is not None:
+            self.runner.cancel()
+            try:
+                await self.runner
+            except asyncio.CancelledError:
+                pass
+            self.runner = None
+
+    def spawn(self, coro):
+        """Run a coroutine as a task and keep a reference until it finishes"""
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def dispatch(self, job: ScheduledJob, callback=None):
+        """Call the job, running it as a task if it is a coroutine function"""
+        try:
+            result = (callback or job.callback)(*job.args)
+            if asyncio.iscoroutine(result):
+                self.spawn(result)
+        except Exception as e:
+            logger.error(f"Scheduled job {job.name} failed: {e}")
+
+    def latest_due(self, job: ScheduledJob, now: datetime):
+        """Return (run, following, missed): the job's latest run due by now, the run after it
+        and how many earlier due runs it stands in for"""
+        run, missed = job.next_run, 0
+        following = job.next_fire(run)
+        while following is not None and following <= now:
+            run, missed = following, missed + 1
+            following = job.next_fire(run)
+        return run, following, missed
+
+    def should_fire(self, job: ScheduledJob, run: datetime, missed: int, now: datetime) -> bool:
+        """Apply the misfire policy to a due run"""
+        late = (now - run).total_seconds()
+        if missed:
+            logger.warning(f"Scheduled job {job.name} missed {missed} run(s), only the latest is considered")
+        if late <= self.misfire_after:
+            return True
+        
+        policy = job.policy or self.policy
+        grace = self.grace if job.grace is None else job.grace
+        fire = policy == COALESCE or (policy == FIRE_LATE and late <= grace)
+        logger.warning(
+            f"Scheduled job {job.name} misfired by {late:.0f}s ({policy}), "
+            f"{'firing it now' if fire else 'skipping the run due at ' + run.isoformat()}"
+        )
+        return fire
+
+    async def run(self):
+        expected_wake = None
+        while True:
+            now = datetime.now(timezone.utc)
+            if expected_wake is not None and (now - expected_wake).total_seconds() > self.misfire_after:
+                logger.warning(f"Scheduler woke {(now - expected_wake).total_seconds():.0f}s late, "
+                               f"the event loop was blocked or the clock jumped")
+            
+            while self.heap and self.heap[0][0] <= now:
+                _, _, job = heapq.heappop(self.heap)
+                if job.cancelled:
+                    continue
+                run, job.next_run, missed = self.latest_due(job, now)
+                if self.should_fire(job, run, missed, now):
+                    self.dispatch(job)
+                elif job.on_skip is not None:
+                    self.dispatch(job, job.on_skip)
+                self._push(job)
+            
+            # Drop cancelled jobs from the top so they don't decide the sleep time
+            while self.heap and self.heap[0][2].cancelled:
+                heapq.heappop(self.heap)
+            
+            delay = self.max_sleep
+            if self.heap:
+                delay = min(delay, (self.heap[0][0] - datetime.now(timezone.utc)).total_seconds())
+            self.wakeup.clear()
+            expected_wake = datetime.now(timezone.utc) + timedelta(seconds=max(0, delay))
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=max(0, delay))
+                expected_wake = None
+            except asyncio.TimeoutError:
+                pass
+
+
+class BroadcastEngine:
+    """Deliver one broadcast to many chats with a bounded number of in-flight sends"""
+
+    def __init__(self, max_concurrency: int = BROADCAST_CONCURRENCY, max_attempts: int = BROADCAST_MAX_ATTEMPTS,
+                 classifier: DeliveryErrorClassifier = None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.classifier = classifier or DeliveryErrorClassifier()
+
+    async def run(self, chat_ids: List[int], send, on_blocked=None, on_result=None,
+                  label: str = "broadcast", gate: asyncio.Event = None, pace: float = None) -> Dict[str, int]:
+        """Call send(chat_id) for every chat and return delivery counts
+
+        No new sends start while gate is cleared, it defaults to the pause gate of the
+        CampaignJob running this campaign. With a pace (chats per second) first sends
+        are spaced evenly instead of going out as fast as the rate limiter allows.
+
+        on_result(chat_id, outcome, result, latency) is called once per chat when it is
+        finished with, outcome is 'sent' (result is the Message) or the final decision
+        for the error (result is the exception), latency is the last attempt in seconds.
+        """
+        success_count = 0
+        failed_count = 0
+        blocked_removed = 0
+        retried_count = 0
+        quarantined_count = 0
+        errors = Counter()
+
+        loop = asyncio.get_running_loop()
+        pending = iter(chat_ids)
+        exhausted = False
+        ready = deque()  # (chat_id, attempt) retries that are due
+        retry_queue = []  # heap of (due, seq, chat_id, attempt)
+        retry_seq = 0
+        in_flight = {}
+        interval = 1 / pace if pace else 0
+        next_start = loop.time()
+        if gate is None:
+            job = current_campaign_job.get()
+            gate = job.gate if job else None
+
+        try:
+            while True:
+                now = loop.time()
+                while retry_queue and retry_queue[0][0] <= now:
+                    _, _, chat_id, attempt = heapq.heappop(retry_queue)
+                    ready.append((chat_id, attempt))
+
+                # Keep up to max_concurrency sends running, the rate limiter paces them
+                while len(in_flight) < self.max_concurrency and (gate is None or gate.is_set()):
+                    if ready:
+                        chat_id, attempt = ready.popleft()
+                    elif not exhausted:
+                        if loop.time() < next_start:
+                            break
+                        chat_id = next(pending, None)
+                        if chat_id is None:
+                            exhausted = True
+                            continue
+                        attempt = 1
+                        next_start = max(next_start, loop.time()) + interval
+                    else:
+                        break
+                    in_flight[asyncio.create_task(send(chat_id))] = (chat_id, attempt, loop.time())
+
+                wake_times = [retry_queue[0][0]] if retry_queue else []
+                if (not exhausted and len(in_flight) < self.max_concurrency
+                        and (gate is None or gate.is_set())):
+                    # Held back by the pace
+                    wake_times.append(next_start)
+
+                if not in_flight:
+                    if gate is not None and not gate.is_set() and (ready or retry_queue or not exhausted):
+                        # Paused, wait for the admin to resume
+                        await gate.wait()
+                        continue
+                    if not wake_times:
+                        break
+                    await asyncio.sleep(max(0, min(wake_times) - loop.time()))
+                    continue
+
+                timeout = max(0, min(wake_times) - loop.time()) if wake_times else None
+                done, _ = await asyncio.wait(in_flight, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    chat_id, attempt, started = in_flight.pop(task)
+                    error = task.exception()
+                    if isinstance(error, BroadcastFormatError):
+                        # The message itself is broken, no chat can get it
+                        raise error
+                    if error is None:
+                        success_count += 1
+                        self.classifier.delivered(chat_id)
+                        if on_result:
+                            on_result(chat_id, 'sent', task.result(), loop.time() - started)
+                        continue
+
+                    error_class, decision, delay = self.classifier.classify(error, attempt, self.max_attempts)
+                    errors[error_class] += 1
+                    if decision == RETRY:
+                        # Park the chat and send again later in this campaign
+                        retry_seq += 1
+                        heapq.heappush(retry_queue, (loop.time() + delay, retry_seq, chat_id, attempt + 1))
+                        retried_count += 1
+                        logger.info(f"Retrying {label} to {chat_id} in {delay:.1f}s: {error}")
+                        continue
+
+                    failed_count += 1
+                    if decision == QUARANTINE:
+                        quarantined_count += 1
+                        if self.classifier.quarantine(chat_id):
+                            decision = DROP
+                    if decision == DROP and on_blocked and on_blocked(chat_id):
+                        blocked_removed += 1
+                    if on_result:
+                        on_result(chat_id, decision, error, loop.time() - started)
+                    logger.warning(f"Failed to send {label} to {chat_id}: {error}")
+        finally:
+            # Sends still running when the campaign is cancelled must not go out unrecorded
+            for task in in_flight:
+                task.cancel()
+
+        logger.info(f"{label.capitalize()} complete: {success_count} sent, {failed_count} failed, {retried_count} retries")
+
+        return {
+            'success': success_count,
+            'failed': failed_count,
+            'blocked_removed': blocked_removed,
+            'retried': retried_count,
+            'quarantined': quarantined_count,
+            'errors': dict(errors)
+        }
+
+
+CHAT_ID_RECORD = struct.Struct('<q')
+
+
+def read_chat_id_records(path: str) -> List[int]:
+    """Chat ids appended to a checkpoint log, a torn last record is ignored"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    usable = len(data) - len(data) % CHAT_ID_RECORD.size
+    return [record[0] for record in CHAT_ID_RECORD.iter_unpack(data[:usable])]
+
+
+class CampaignCheckpoint:
+    """On-disk progress of one campaign
+
+    Recipients are frozen when the campaign starts as a sorted array of chat ids.
+    Every chat that is finished with (sent, dropped or given up on) is appended to
+    a log, one per worker process, and the logs are folded into a bitmap over the
+    recipient indices when the campaign is loaded again.
+    """
+
+    def __init__(self, directory: str, campaign_id: str):
+        self.campaign_id = campaign_id
+        base = os.path.join(directory, campaign_id)
+        self.meta_file = f"{base}.json"
+        self.recipients_file = f"{base}.recipients"
+        self.bitmap_file = f"{base}.bitmap"
+        self.log_file = f"{base}.log"
+        self.meta = {}
+        self.recipients = array('q')
+        self.bitmap = bytearray()
+        self.log_handle = None
+
+    def create(self, meta: Dict, chat_ids: List[int]) -> 'CampaignCheckpoint':
+        """Freeze the recipients and write an empty checkpoint"""
+        self.recipients = array('q', sorted(set(chat_ids)))
+        self.bitmap = bytearray((len(self.recipients) + 7) // 8)
+        self.meta = {
+            'campaign_id': self.campaign_id,
+            'created_at': datetime.now().isoformat(),
+            'total': len(self.recipients),
+            **meta
+        }
+        with open(self.recipients_file, 'wb') as f:
+            self.recipients.tofile(f)
+        self.write_bitmap()
+        temp_file = f"{self.meta_file}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(temp_file, self.meta_file)
+        return self
+
+    def load(self) -> 'CampaignCheckpoint':
+        """Read a checkpoint back and fold its logs into the bitmap"""
+        with open(self.meta_file, 'r') as f:
+            self.meta = json.load(f)
+        self.recipients = array('q')
+        with open(self.recipients_file, 'rb') as f:
+            self.recipients.frombytes(f.read())
+        try:
+            with open(self.bitmap_file, 'rb') as f:
+                self.bitmap = bytearray(f.read())
+        except FileNotFoundError:
+            self.bitmap = bytearray((len(self.recipients) + 7) // 8)
+
+        log_files = self.log_files()
+        for path in log_files:
+            for chat_id in read_chat_id_records(path):
+                self.set_done(chat_id)
+        self.write_bitmap()
+        for path in log_files:
+            os.remove(path)
+        return self
+
+    def write_bitmap(self):
+        temp_file = f"{self.bitmap_file}.tmp"
+        with open(temp_file, 'wb') as f:
+            f.write(self.bitmap)
+        os.replace(temp_file, self.bitmap_file)
+
+    def log_files(self) -> List[str]:
+        return glob.glob(f"{glob.escape(self.log_file)}*")
+
+    def shard_log(self, shard: int) -> str:
+        """Log file a worker process appends its finished chats to"""
+        return f"{self.log_file}.{shard}"
+
+    def set_done(self, chat_id: int):
+        index = bisect.bisect_left(self.recipients, chat_id)
+        if index < len(self.recipients) and self.recipients[index] == chat_id:
+            self.bitmap[index >> 3] |= 1 << (index & 7)
+
+    def mark(self, chat_id: int):
+        """Record that a chat is finished with"""
+        if self.log_handle is None:
+            self.log_handle = open(self.log_file, 'ab', buffering=0)
+        self.log_handle.write(CHAT_ID_RECORD.pack(chat_id))
+        self.set_done(chat_id)
+
+    def pending(self) -> List[int]:
+        """Recipients not finished with yet"""
+        bitmap = self.bitmap
+        return [chat_id for index, chat_id in enumerate(self.recipients) if not bitmap[index >> 3] >> (index & 7) & 1]
+
+    def done_count(self) -> int:
+        return bin(int.from_bytes(self.bitmap, 'little')).count('1')
+
+    def close(self):
+        if self.log_handle is not None:
+            self.log_handle.close()
+            self.log_handle = None
+
+    def remove(self):
+        """Delete the checkpoint of a finished campaign"""
+        self.close()
+        for path in [self.meta_file, self.recipients_file, self.bitmap_file] + self.log_files():
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class CampaignStore:
+    """Checkpoints of the campaigns that have not finished yet"""
+
+    def __init__(self, directory: str = CAMPAIGN_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def new_id(self) -> str:
+        """Id that is never reused, even after the checkpoint of an earlier campaign was removed"""
+        # Sorts by start time, the random part keeps campaigns of the same millisecond apart
+        return f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')[:-3]}-{uuid.uuid4().hex[:6]}"
+
+    def create(self, label: str, compiled: 'CompiledBroadcast', chat_ids: List[int],
+               window: float = None) -> CampaignCheckpoint:
+        """Start a checkpoint for a new campaign to chat_ids, spread over window minutes if given"""
+        meta = {
+            'label': label,
+            'text': compiled.text,
+            'reply_markup': compiled.reply_markup,
+            'image': compiled.image
+        }
+        if window:
+            meta['deliver_by'] = (datetime.now(timezone.utc) + timedelta(minutes=window)).isoformat()
+        return CampaignCheckpoint(self.directory, self.new_id()).create(meta, chat_ids)
+
+    def unfinished(self) -> List[CampaignCheckpoint]:
+        """Campaigns interrupted by a restart, oldest first"""
+        checkpoints = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith('.json'):
+                continue
+            checkpoint = CampaignCheckpoint(self.directory, name[:-len('.json')])
+            try:
+                checkpoints.append(checkpoint.load())
+            except (OSError, ValueError) as e:
+                logger.error(f"Cannot load campaign checkpoint {name}: {e}")
+        return checkpoints
+
+
+def delivery_pace(meta: Dict, remaining: int) -> Optional[float]:
+    """Chats per second that spread the remaining chats evenly until the campaign's deliver_by
+
+    None when the campaign has no window or is already past it, then it goes out at full speed.
+    """
+    if not meta.get('deliver_by') or not remaining:
+        return None
+    seconds = (datetime.fromisoformat(meta['deliver_by']) - datetime.now(timezone.utc)).total_seconds()
+    if seconds <= 0:
+        return None
+    return remaining / seconds
+
+
+LEDGER_RECORD = struct.Struct('<qiBI')  # chat_id, message_id, outcome, latency in ms
+LEDGER_OUTCOMES = ['sent', DROP, QUARANTINE, FAIL]
+AMBIGUOUS_CAMPAIGN_TEXT = (
+    "⚠️ Several campaigns were recorded under this id, so their deliveries can't be "
+    "told apart. It can't be edited or recalled."
+)
+
+
+def pack_ledger_record(chat_id: int, outcome: str, result, latency: float) -> bytes:
+    """Binary ledger record for one finished chat"""
+    message_id = getattr(result, 'message_id', 0) if outcome == 'sent' else 0
+    latency_ms = min(int(latency * 1000), 0xFFFFFFFF)
+    return LEDGER_RECORD.pack(chat_id, message_id or 0, LEDGER_OUTCOMES.index(outcome), latency_ms)
+
+
+class DeliveryLedger:
+    """Append-only record of what happened to every chat of every campaign
+
+    Each campaign has a file of fixed-size binary records (chat id, message id,
+    outcome, latency), shard workers append to files of their own next to it.
+    campaigns.jsonl lists finished campaigns with their message and totals.
+    """
+
+    def __init__(self, directory: str = LEDGER_DIR):
+        self.directory = directory
+        self.index_file = os.path.join(directory, 'campaigns.jsonl')
+        os.makedirs(directory, exist_ok=True)
+
+    def ledger_file(self, campaign_id: str) -> str:
+        return os.path.join(self.directory, f"{campaign_id}.ledger")
+
+    def shard_file(self, campaign_id: str, shard: int) -> str:
+        """Ledger file a worker process appends its records to"""
+        return f"{self.ledger_file(campaign_id)}.{shard}"
+
+    def open(self, campaign_id: str):
+        """Unbuffered handle to append records of a campaign to"""
+        return open(self.ledger_file(campaign_id), 'ab', buffering=0)
+
+    def records(self, campaign_id: str):
+        """Yield (chat_id, message_id, outcome, latency_ms) for every finished chat of a campaign"""
+        for path in sorted(glob.glob(f"{glob.escape(self.ledger_file(campaign_id))}*")):
+            with open(path, 'rb') as f:
+                data = f.read()
+            usable = len(data) - len(data) % LEDGER_RECORD.size
+            for chat_id, message_id, outcome, latency_ms in LEDGER_RECORD.iter_unpack(data[:usable]):
+                yield chat_id, message_id, LEDGER_OUTCOMES[outcome], latency_ms
+
+    def delivered(self, campaign_id: str) -> List[tuple]:
+        """(chat_id, message_id, shard) of every message a campaign sent, shard is None for the bot process"""
+        main_file = self.ledger_file(campaign_id)
+        delivered = []
+        for path in sorted(glob.glob(f"{glob.escape(main_file)}*")):
+            shard = None if path == main_file else int(path[len(main_file) + 1:])
+            with open(path, 'rb') as f:
+                data = f.read()
+            usable = len(data) - len(data) % LEDGER_RECORD.size
+            for chat_id, message_id, outcome, _ in LEDGER_RECORD.iter_unpack(data[:usable]):
+                if LEDGER_OUTCOMES[outcome] == 'sent' and message_id:
+                    delivered.append((chat_id, message_id, shard))
+        return delivered
+
+    def summary(self, campaign_id: str) -> Dict[str, Any]:
+        """Chats per outcome plus median and 95th percentile send latency"""
+        outcomes = Counter()
+        latencies = []
+        for _, _, outcome, latency_ms in self.records(campaign_id):
+            outcomes[outcome] += 1
+            if outcome == 'sent':
+                latencies.append(latency_ms)
+        latencies.sort()
+        summary = {'outcomes': dict(outcomes), 'latency_p50_ms': None, 'latency_p95_ms': None}
+        if latencies:
+            summary['latency_p50_ms'] = latencies[len(latencies) // 2]
+            summary['latency_p95_ms'] = latencies[min(len(latencies) - 1, len(latencies) * 95 // 100)]
+        return summary
+
+    def follower(self, campaign_id: str):
+        """Function returning outcome counts from the shard worker files of a campaign, reading only new records"""
+        offsets = {}
+        counts = Counter()
+
+        def poll() -> Counter:
+            for path in glob.glob(f"{glob.escape(self.ledger_file(campaign_id))}.*"):
+                offset = offsets.get(path, 0)
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    data = f.read()
+                usable = len(data) - len(data) % LEDGER_RECORD.size
+                offsets[path] = offset + usable
+                for record in LEDGER_RECORD.iter_unpack(data[:usable]):
+                    counts[LEDGER_OUTCOMES[record[2]]] += 1
+            return counts
+
+        return poll
+
+    def finish(self, meta: Dict, results: Dict):
+        """Add a finished campaign to the index"""
+        entry = {**meta, 'finished_at': datetime.now().isoformat(), 'results': results}
+        with open(self.index_file, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def campaigns(self) -> List[Dict]:
+        """Index entries of finished campaigns, oldest first"""
+        try:
+            with open(self.index_file, 'r') as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def campaign(self, campaign_id: str) -> Optional[Dict]:
+        for entry in reversed(self.campaigns()):
+            if entry['campaign_id'] == campaign_id:
+                return entry
+        return None
+
+    def is_ambiguous(self, campaign_id: str) -> bool:
+        """True when several finished campaigns share the id (ids used to be only second-precise)
+
+        Their deliveries are mixed in the same ledger files, so they can't be told apart.
+        """
+        return sum(1 for entry in self.campaigns() if entry['campaign_id'] == campaign_id) > 1
+
+
+class ProgressReporter:
+    """Live progress of a campaign in an admin's message
+
+    Finished chats only bump counters. One background task renders them and edits
+    the message when the text changed, at most once per interval, so the progress
+    feed costs a handful of requests however fast the campaign goes.
+    """
+
+    def __init__(self, message, label: str = "broadcast", interval: float = PROGRESS_UPDATE_INTERVAL):
+        self.message = message
+        self.label = label
+        self.interval = max(1.0, interval)
+        self.total = 0
+        self.sent = 0
+        self.failed = 0
+        self.poll = None
+        self.started = None  # loop time of start(), None while the job is still queued
+        self.task = None
+        self.last_text = None
+        self.job = None  # CampaignJob whose pause/resume/cancel buttons are shown
+
+    def start(self, total: int, poll=None):
+        """Begin reporting, poll() may return outcome counts of work done in other processes"""
+        self.total = total
+        self.poll = poll
+        self.started = asyncio.get_running_loop().time()
+        self.task = asyncio.create_task(self.run())
+
+    def record(self, outcome: str):
+        if outcome == 'sent':
+            self.sent += 1
+        else:
+            self.failed += 1
+
+    def counts(self):
+        sent, failed = self.sent, self.failed
+        if self.poll:
+            polled = self.poll()
+            sent += polled.get('sent', 0)
+            failed += sum(polled.values()) - polled.get('sent', 0)
+        return sent, failed
+
+    def render(self, state: str = "running") -> str:
+        sent, failed = self.counts()
+        done = sent + failed
+        remaining = max(0, self.total - done)
+        elapsed = None
+        rate = 0.0
+        if self.started is not None:
+            elapsed = max(0.001, asyncio.get_running_loop().time() - self.started)
+            rate = done / elapsed
+        percent = done * 100 // self.total if self.total else (0 if self.started is None else 100)
+        filled = percent // 10
+        
+        if state == 'running' and self.job and self.job.paused:
+            state = 'paused'
+        titles = {
+            'running': "📤 *Broadcasting...*",
+            'paused': "⏸ *Broadcast Paused*",
+            'done': "✅ *Broadcast Complete!*",
+            'cancelled': "⛔ *Broadcast Cancelled*",
+            'interrupted': "⚠️ *Broadcast Interrupted*"
+        }
+        text = f"{titles[state]} ({self.label})\n\n"
+        text += f"{'▓' * filled}{'░' * (10 - filled)} {percent}%\n\n"
+        text += f"✅ Sent: {sent}\n"
+        text += f"❌ Failed: {failed}\n"
+        text += f"⏳ Remaining: {remaining}\n"
+        text += f"🚀 Rate: {rate:.1f} msg/s\n"
+        if state == 'running':
+            eta = int(remaining / rate) if rate > 0 else None
+            text += f"⏱ ETA: {f'{eta // 60}m {eta % 60}s' if eta is not None else 'calculating...'}"
+        elif state == 'paused':
+            text += "⏱ ETA: paused"
+        elif elapsed is None:
+            text += "⏱ Never started"
+        else:
+            text += f"⏱ Took: {int(elapsed) // 60}m {int(elapsed) % 60}s"
+        return text
+
+    def controls(self, finished: bool = False) -> Optional[InlineKeyboardMarkup]:
+        """Pause/resume and cancel buttons of the job while it runs"""
+        if finished or not self.job:
+            return None
+        job_id = self.job.job_id
+        if self.job.paused:
+            toggle = InlineKeyboardButton("▶️ Resume", callback_data=f"job_resume_{job_id}")
+        else:
+            toggle = InlineKeyboardButton("⏸ Pause", callback_data=f"job_pause_{job_id}")
+        return InlineKeyboardMarkup([[toggle, InlineKeyboardButton("⛔ Cancel", callback_data=f"job_cancel_{job_id}")]])
+
+    async def run(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.interval)
+
+    async def refresh(self):
+        """Show the current counts and buttons right away"""
+        await self.update(self.render(), self.controls())
+
+    async def update(self, text: str, reply_markup: InlineKeyboardMarkup = None):
+        if text == self.last_text:
+            return
+        try:
+            await self.message.edit_text(text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+            self.last_text = text
+        except BadRequest as e:
+            if "message is not modified" not in e.message.lower():
+                logger.warning(f"Cannot update progress message: {e}")
+        except TelegramError as e:
+            logger.warning(f"Cannot update progress message: {e}")
+
+    async def finish(self, completed: bool = True):
+        """Stop the periodic edits and show the final counts"""
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        if completed:
+            state = 'done'
+        elif self.job and self.job.state == 'cancelled':
+            state = 'cancelled'
+        else:
+            state = 'interrupted'
+        await self.update(self.render(state), self.controls(finished=True))
+
+
+def merge_broadcast_results(results_list: List[Dict]) -> Dict:
+    """Add up the result dicts of several BroadcastEngine runs"""
+    merged = {'success': 0, 'failed': 0, 'blocked_removed': 0, 'retried': 0, 'quarantined': 0}
+    errors = Counter()
+    for results in results_list:
+        for key, value in results.items():
+            if key == 'errors':
+                errors.update(value)
+            else:
+                merged[key] = merged.get(key, 0) + value
+    merged['errors'] = dict(errors)
+    return merged
+
+
+async def deliver_shard(token: str, chat_ids: List[int], text: str, reply_markup: Optional[str], image: Optional[str],
+                        file_ids: Dict[str, str], strikes: Dict[int, int], global_rate: float, label: str,
+                        checkpoint_log: Optional[str] = None, ledger_file: Optional[str] = None,
+                        primary: bool = True, control=None, pace: Optional[float] = None) -> Dict:
+    """Deliver a broadcast to one shard of chats with a bot of its own"""
+    bot = ExtBot(
+        token,
+        request=HTTPXRequest(connection_pool_size=BROADCAST_CONCURRENCY + 4),
+        rate_limiter=TelegramRateLimiter(global_rate=global_rate)
+    )
+    media_cache = MediaCache(None)
+    media_cache.file_ids.update(file_ids)
+    classifier = DeliveryErrorClassifier()
+    classifier.strikes.update(strikes)
+    engine = BroadcastEngine(classifier=classifier)
+    dropped = []
+
+    log_handle = open(checkpoint_log, 'ab', buffering=0) if checkpoint_log else None
+    ledger_handle = open(ledger_file, 'ab', buffering=0) if ledger_file else None
+
+    def on_blocked(chat_id):
+        dropped.append(chat_id)
+        return True
+
+    def on_result(chat_id, outcome, result, latency):
+        # Chats dropped by another token are retried by the main bot, which records them
+        if outcome == DROP and not primary:
+            return
+        if log_handle:
+            log_handle.write(CHAT_ID_RECORD.pack(chat_id))
+        if ledger_handle:
+            ledger_handle.write(pack_ledger_record(chat_id, outcome, result, latency))
+
+    gate = asyncio.Event()
+    gate.set()
+    cancelled = False
+    try:
+        async with bot:
+            compiled = CompiledBroadcast(bot, text, reply_markup, image, media_cache)
+            run_task = asyncio.create_task(engine.run(chat_ids, compiled.send, on_blocked=on_blocked,
+                                                      on_result=on_result, label=label, gate=gate, pace=pace))
+            watcher = asyncio.create_task(follow_shard_control(control, gate, run_task)) if control is not None else None
+            try:
+                results = await run_task
+            except asyncio.CancelledError:
+                results = merge_broadcast_results([])
+                cancelled = True
+            finally:
+                if watcher:
+                    watcher.cancel()
+    finally:
+        if log_handle:
+            log_handle.close()
+        if ledger_handle:
+            ledger_handle.close()
+    return {'results': results, 'dropped': dropped, 'strikes': classifier.strikes, 'cancelled': cancelled}
+
+
+async def follow_shard_control(control, gate: asyncio.Event, task: asyncio.Task):
+    """Apply pause, resume and cancel requests of the coordinator inside a shard worker"""
+    while not task.done():
+        state = control.get('state', 'running')
+        if state == 'cancelled':
+            task.cancel()
+            return
+        if state == 'paused':
+            gate.clear()
+        else:
+            gate.set()
+        await asyncio.sleep(0.5)
+
+
+def run_broadcast_shard(shard: Dict) -> Dict:
+    """Worker process entry point for ShardedBroadcaster"""
+    return asyncio.run(deliver_shard(**shard))
+
+
+def bot_id_of(token: str) -> str:
+    """The bot's numeric id, the public part of its token"""
+    return token.split(':', 1)[0]
+
+
+class ShardedBroadcaster:
+    """Split a broadcast over worker processes, each with its own bot, HTTP pool and rate budget
+
+    Chats are assigned to shards by chat_id modulo the worker count. Workers using the
+    same token share its global rate limit, extra tokens bring a budget of their own.
+    The main process counts as one more user of the primary token: while shards run,
+    its limiter is lowered to the same share.
+    """
+
+    def __init__(self, tokens: List[str], workers: int = BROADCAST_WORKERS,
+                 main_limiter: TelegramRateLimiter = None):
+        self.tokens = tokens
+        self.workers = max(1, workers, len(tokens))
+        self.main_limiter = main_limiter
+        self.running = 0  # runs in progress, the main limiter is restored when the last one ends
+        self.pool = None
+        self.manager = None
+
+    def shard_of(self, chat_id: int) -> int:
+        return chat_id % self.workers
+
+    def token_of(self, shard: int) -> str:
+        return self.tokens[shard % len(self.tokens)]
+
+    def executor(self) -> ProcessPoolExecutor:
+        if self.pool is None:
+            # Spawned workers do not inherit the bot's event loop, sockets or database handles
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self.pool
+
+    def control(self):
+        """Shared dict through which the workers of one run are paused, resumed or cancelled"""
+        if self.manager is None:
+            self.manager = multiprocessing.get_context('spawn').Manager()
+        return self.manager.dict(state='running')
+
+    async def run(self, chat_ids: List[int], compiled: CompiledBroadcast, file_ids: Dict[str, str],
+                  strikes: Dict[int, int], label: str, checkpoint: CampaignCheckpoint = None,
+                  ledger: DeliveryLedger = None, pace: float = None) -> List[Dict]:
+        """Deliver to all chats, returns one outcome per shard that had chats
+
+        A pace for the whole campaign is split over the shards by their size.
+        """
+        job = current_campaign_job.get()
+        control = None
+        if job:
+            control = self.control()
+            if job.paused:
+                control['state'] = 'paused'
+            job.controls.append(control)
+        shards = [[] for _ in range(self.workers)]
+        for chat_id in chat_ids:
+            shards[self.shard_of(chat_id)].append(chat_id)
+        workers_per_token = Counter(self.token_of(index) for index in range(self.workers))
+        # Replies, other campaigns and fallbacks keep going out from this process on the primary token
+        workers_per_token[self.tokens[0]] += 1
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        indexes = []
+        for index, shard in enumerate(shards):
+            if not shard:
+                continue
+            token = self.token_of(index)
+            primary = token == self.tokens[0]
+            if checkpoint:
+                # Messages can only be edited or deleted later by the bot that sent them
+                checkpoint.meta.setdefault('senders', {})[str(index)] = bot_id_of(token)
+            spec = {
+                'token': token,
+                'chat_ids': shard,
+                'text': compiled.text,
+                'reply_markup': compiled.reply_markup,
+                'image': compiled.image,
+                # file_ids only work for the bot that uploaded the file
+                'file_ids': file_ids if primary else {},
+                'strikes': {chat_id: count for chat_id, count in strikes.items() if self.shard_of(chat_id) == index},
+                'global_rate': GLOBAL_RATE_LIMIT / workers_per_token[token],
+                'label': f"{label} shard {index + 1}/{self.workers}",
+                'checkpoint_log': checkpoint.shard_log(index) if checkpoint else None,
+                'ledger_file': ledger.shard_file(checkpoint.campaign_id, index) if ledger and checkpoint else None,
+                'primary': primary,
+                'control': control,
+                'pace': pace * len(shard) / len(chat_ids) if pace else None
+            }
+            futures.append(loop.run_in_executor(self.executor(), run_broadcast_shard, spec))
+            indexes.append(index)
+
+        if self.main_limiter:
+            self.main_limiter.set_global_rate(GLOBAL_RATE_LIMIT / workers_per_token[self.tokens[0]])
+        self.running += 1
+        try:
+            # Shielded so a cancelled campaign can tell its workers to stop and wait for them
+            outcomes = await asyncio.gather(*(asyncio.shield(future) for future in futures))
+        except (asyncio.CancelledError, BroadcastFormatError):
+            if control is not None:
+                control['state'] = 'cancelled'
+            await asyncio.wait(futures)
+            raise
+        finally:
+            if job:
+                job.controls.remove(control)
+            self.running -= 1
+            if self.main_limiter and not self.running:
+                self.main_limiter.set_global_rate(GLOBAL_RATE_LIMIT)
+        for index, outcome in zip(indexes, outcomes):
+            outcome['shard'] = index
+            outcome['primary'] = self.token_of(index) == self.tokens[0]
+        return outcomes
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+        if self.manager is not None:
+            self.manager.shutdown()
+            self.manager = None
+
+
+class CampaignJob:
+    """Handle of a campaign submitted to the CampaignExecutor, awaiting it gives the campaign's result"""
+
+    def __init__(self, job_id: int, name: str, progress: ProgressReporter = None, on_discard=None):
+        self.job_id = job_id
+        self.name = name
+        self.progress = progress
+        self.on_discard = on_discard  # called when an admin cancels the job before it started
+        self.state = 'queued'
+        self.gate = asyncio.Event()  # cleared while paused
+        self.gate.set()
+        self.controls = []  # shard worker control dicts of the running campaign
+        self.task = None
+        self.created_at = datetime.now()
+
+    def __await__(self):
+        return self.task.__await__()
+
+    @property
+    def paused(self) -> bool:
+        return self.state == 'paused'
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ('done', 'failed', 'cancelled')
+
+    def pause(self) -> bool:
+        if self.state != 'running':
+            return False
+        self.state = 'paused'
+        self.gate.clear()
+        for control in self.controls:
+            control['state'] = 'paused'
+        return True
+
+    def resume(self) -> bool:
+        if self.state != 'paused':
+            return False
+        self.state = 'running'
+        self.gate.set()
+        for control in self.controls:
+            control['state'] = 'running'
+        return True
+
+    def cancel(self) -> bool:
+        if self.finished:
+            return False
+        self.state = 'cancelled'
+        self.gate.set()
+        self.task.cancel()
+        return True
+
+
+class CampaignExecutor:
+    """Run broadcast campaigns as background jobs on the bot's event loop, a limited number at a time"""
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_CAMPAIGNS, keep_finished: int = 20):
+        self.max_concurrent = max(1, max_concurrent)
+        self.slots = asyncio.Semaphore(self.max_concurrent)
+        self.keep_finished = keep_finished
+        self.jobs = {}
+        self.last_id = 0
+
+    def submit(self, coro, name: str = "campaign", progress: ProgressReporter = None,
+               on_discard=None) -> CampaignJob:
+        """Start a campaign coroutine and return its job right away, it waits for a free slot before running"""
+        self.last_id += 1
+        job = CampaignJob(self.last_id, name, progress, on_discard)
+        if progress:
+            progress.job = job
+        job.task = asyncio.create_task(self._run(job, coro))
+        self.jobs[job.job_id] = job
+        self.prune()
+        return job
+
+    def get(self, job_id: int) -> Optional[CampaignJob]:
+        return self.jobs.get(job_id)
+
+    def active(self) -> List[CampaignJob]:
+        return [job for job in self.jobs.values() if not job.finished]
+
+    def prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self.jobs[job_id]
+
+    async def _run(self, job: CampaignJob, coro):
+        current_campaign_job.set(job)
+        started = False
+        try:
+            async with self.slots:
+                if job.state == 'queued':
+                    job.state = 'running'
+                started = True
+                result = await coro
+            job.state = 'done'
+            return result
+        except asyncio.CancelledError:
+            # Cancelled by an admin while still queued, a shutdown leaves the job to be resumed
+            if not started and job.state == 'cancelled' and job.on_discard:
+                job.on_discard()
+            job.state = 'cancelled'
+            logger.info(f"{job.name.capitalize()} cancelled")
+        except Exception as e:
+            job.state = 'failed'
+            logger.error(f"{job.name.capitalize()} failed: {e}")
+        finally:
+            coro.close()
+
+
+class BroadcastMerger:
+    """Collect scheduled broadcasts that fire close together into one campaign job
+
+    The first broadcast added opens a batch, everything added within merge_seconds joins
+    it, then deliver(parts) runs for the whole batch as a single job of the executor. Parts
+    arrive already checkpointed, so a restart while they wait resumes them.
+    """
+
+    def __init__(self, executor: CampaignExecutor, deliver, merge_seconds: float = CAMPAIGN_MERGE_SECONDS):
+        self.executor = executor
+        self.deliver = deliver
+        self.merge_seconds = merge_seconds
+        self.parts = None
+        self.submitted = None  # resolves to the CampaignJob of the open batch
+
+    async def add(self, part: Dict):
+        """Deliver part with whatever else fires in the same window and wait until the batch is done"""
+        if self.merge_seconds <= 0:
+            return await self.executor.submit(self.deliver([part]), name=part['label'],
+                                              on_discard=lambda: self.discard([part]))
+        loop = asyncio.get_running_loop()
+        if self.parts is None:
+            self.parts = []
+            self.submitted = loop.create_future()
+            loop.call_later(max(0, self.merge_seconds), self.flush)
+        self.parts.append(part)
+        job = await asyncio.shield(self.submitted)
+        return await job
+
+    def flush(self):
+        parts, submitted = self.parts, self.submitted
+        self.parts = self.submitted = None
+        if len(parts) == 1:
+            name = parts[0]['label']
+        else:
+            name = f"{len(parts)} merged scheduled broadcasts"
+            logger.info(f"Merging {len(parts)} scheduled broadcasts that fired together: "
+                        f"{', '.join(part['label'] for part in parts)}")
+        submitted.set_result(self.executor.submit(self.deliver(parts), name=name,
+                                                  on_discard=lambda: self.discard(parts)))
+
+    @staticmethod
+    def discard(parts: List[Dict]):
+        """Drop the checkpoints of parts cancelled before they were delivered, so they are not resumed"""
+        for part in parts:
+            part['checkpoint'].remove()
+
+
 class ScheduledTelegramBot:
     def __init__(self):
         self.bot_token = os.getenv('BOT_TOKEN')
         self.subscribers_file = 'subscribers.json'
+        self.subscribers_log_file = 'subscribers.log'
         self.schedule_file = 'broadcast_schedule.json'
         self.messages_file = 'scheduled_messages.json'
+        self.history_file = 'broadcast_history.jsonl'
+        self.one_time_file = 'one_time_broadcasts.json'
+        self.timezones_file = 'subscriber_timezones.json'
+        self.storage = self.open_storage()
         self.subscribers = self.load_subscribers()
+        # Timezones subscribers picked with /timezone, for local-time delivery
+        self.subscriber_timezones = self.load_subscriber_timezones()
+        # Unreachable chats found by broadcasts are removed in batches
+        self.pending_removals = PendingRemovals(self.subscribers, 'pending_removals.journal')
         self.scheduled_messages = self.load_scheduled_messages()
         self.application = None
         # ADD YOUR TELEGRAM USER ID HERE FOR ADMIN ACCESS
@@ -40,23 +2380,64 @@ class ScheduledTelegramBot:
         # Conversation states for broadcast creation
         self.broadcast_states = {}
         self.temp_broadcast_data = {}
-        self.one_time_broadcasts = []  # List to store one-time scheduled broadcasts
-        
-    def load_subscribers(self) -> List[int]:
-        """Load subscribers from file"""
-        try:
-            with open(self.subscribers_file, 'r') as f:
-                data = json.load(f)
-                return data.get('subscribers', [])
-        except FileNotFoundError:
-            return []
+        self.one_time_broadcasts = OneTimeBroadcastQueue(self.storage)  # Survives restarts
+        
+        self.media_cache = MediaCache('media_cache.json')
+        
+        # Shared delivery engine used by every broadcast path
+        self.broadcast_engine = BroadcastEngine()
+        # Applied to every Bot API request made through self.application.bot
+        self.rate_limiter = TelegramRateLimiter()
+        # Large broadcasts can be split over worker processes and extra bot tokens
+        self.sharded_broadcaster = None
+        worker_tokens = [token.strip() for token in BROADCAST_WORKER_TOKENS.split(',') if token.strip()]
+        if BROADCAST_WORKERS > 1 or worker_tokens:
+            self.sharded_broadcaster = ShardedBroadcaster([self.bot_token] + worker_tokens,
+                                                          main_limiter=self.rate_limiter)
+        # Every campaign runs as a task on the application's event loop
+        self.campaigns = CampaignExecutor()
+        # Scheduled broadcasts firing together share one delivery
+        self.merger = BroadcastMerger(self.campaigns, self.deliver_merged)
+        # Checkpoints let campaigns interrupted by a restart pick up where they stopped
+        self.campaign_store = CampaignStore()
+        self.ledger = DeliveryLedger()
+        # Fires daily/weekly/one-time jobs on the application's event loop
+        self.scheduler = AsyncScheduler()
+        # Scheduler jobs of every active schedule entry (one per timezone for local delivery), by entry id
+        self.schedule_jobs = {}
+        
+    def open_storage(self):
+        """Open the configured storage backend"""
+        if STORAGE_BACKEND == 'sqlite':
+            storage = SQLiteStorage(SQLITE_DB_FILE)
+            storage.import_json(self.subscribers_file, self.subscribers_log_file, self.messages_file, self.one_time_file,
+                                self.timezones_file)
+            return storage
+        return JsonStorage(self.subscribers_file, self.subscribers_log_file, self.messages_file, self.history_file,
+                           self.one_time_file, self.timezones_file)
+    
+    def load_subscribers(self):
+        """Load subscribers from storage"""
+        return self.storage.open_subscribers()
+    
+    def load_subscriber_timezones(self) -> Dict[int, str]:
+        """Load subscriber timezones, dropping ones that are no longer valid and respelling the rest"""
+        timezones = {}
+        for chat_id, zone in self.storage.load_subscriber_timezones().items():
+            try:
+                canonical = canonical_timezone(zone)
+            except ValueError:
+                canonical = None
+            if canonical != zone:
+                self.storage.save_subscriber_timezone(chat_id, canonical)
+            if canonical:
+                timezones[chat_id] = canonical
+        return timezones
     
     def load_scheduled_messages(self) -> List[Dict]:
-        """Load scheduled messages from file"""
-        try:
-            with open(self.messages_file, 'r') as f:
-                return json.load(f)
-        except FileNotFoundError:
+        """Load scheduled messages from storage"""
+        messages = self.storage.load_scheduled_messages()
+        if messages is None:
             return [
                 {
                     "id": 1,
@@ -73,37 +2454,37 @@ class ScheduledTelegramBot:
                     "type": "daily"
                 }
             ]
+        return messages
     
     def save_subscribers(self):
         """Save subscribers to file"""
-        data = {
-            'subscribers': self.subscribers,
-            'total_count': len(self.subscribers),
-            'last_updated': datetime.now().isoformat()
-        }
-        with open(self.subscribers_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        self.subscribers.compact()
     
     def save_scheduled_messages(self):
-        """Save scheduled messages to file"""
-        with open(self.messages_file, 'w') as f:
-            json.dump(self.scheduled_messages, f, indent=2)
+        """Save scheduled messages to storage"""
+        self.storage.save_scheduled_messages(self.scheduled_messages)
+    
+    def next_schedule_id(self) -> int:
+        """Get an id that no scheduled message uses yet"""
+        return max((msg['id'] for msg in self.scheduled_messages), default=0) + 1
     
     def add_subscriber(self, chat_id: int) -> bool:
         """Add new subscriber"""
-        if chat_id not in self.subscribers:
-            self.subscribers.append(chat_id)
-            self.save_subscribers()
+        # A chat that blocked us mid-broadcast and came back must not be removed by the next flush
+        returning = self.pending_removals.discard(chat_id)
+        if self.subscribers.add(chat_id):
             logger.info(f"New subscriber added: {chat_id}")
             return True
+        if returning:
+            logger.info(f"Subscriber {chat_id} came back before their removal was applied")
         return False
     
     def remove_subscriber(self, chat_id: int) -> bool:
         """Remove subscriber"""
-        if chat_id in self.subscribers:
-            self.subscribers.remove(chat_id)
-            self.save_subscribers()
+        if self.subscribers.remove(chat_id):
             logger.info(f"Subscriber removed: {chat_id}")
+            if self.subscriber_timezones.pop(chat_id, None):
+                self.storage.save_subscriber_timezone(chat_id, None)
             return True
         return False
     
@@ -190,13 +2571,15 @@ Ready to start earning? Let's grow! 💎
                 # Check file size (skip if too large)
                 file_size = os.path.getsize(welcome_image)
                 if file_size < 10 * 1024 * 1024:  # Less than 10MB
-                    with open(welcome_image, 'rb') as photo:
-                        await update.message.reply_photo(
+                    await self.media_cache.send(
+                        welcome_image,
+                        lambda photo: update.message.reply_photo(
                             photo=photo,
                             caption=welcome_message,
                             parse_mode=ParseMode.MARKDOWN,
                             reply_markup=reply_markup
                         )
+                    )
                     return
         except Exception as e:
             logger.warning(f"Failed to send image: {e}")
@@ -254,31 +2637,274 @@ Ready to start earning? Let's grow! 💎
         )
     
     def get_next_broadcast_time(self) -> str:
-        """Get next scheduled broadcast time"""
-        now = datetime.now()
-        today_times = []
-        
-        for msg in self.scheduled_messages:
-            if msg['active']:
-                time_parts = msg['time'].split(':')
-                broadcast_time = now.replace(hour=int(time_parts[0]), minute=int(time_parts[1]), second=0, microsecond=0)
-                
-                if broadcast_time <= now:
-                    broadcast_time += timedelta(days=1)
-                
-                today_times.append(broadcast_time)
-        
-        if today_times:
-            next_time = min(today_times)
-            return next_time.strftime('%Y-%m-%d %H:%M')
-        return "Not scheduled"
+        """Get next scheduled broadcast time, read from the scheduler's queue so both always agree"""
+        next_run = self.scheduler.next_run()
+        if next_run is None:
+            return "Not scheduled"
+        return next_run.strftime('%Y-%m-%d %H:%M UTC')
     
-    async def broadcast_to_all(self, message: str, message_type: str = "scheduled") -> Dict[str, int]:
-        """Broadcast message to all subscribers"""
-        success_count = 0
-        failed_count = 0
-        blocked_users = []
-        
+    async def deliver_broadcast(self, text: str, reply_markup, image: str = None, label: str = "broadcast",
+                                progress: ProgressReporter = None, chat_ids: List[int] = None,
+                                window: float = None) -> Dict[str, int]:
+        """Send text (or an image with caption) to chat_ids, all subscribers by default, through the broadcast engine
+
+        With a window (minutes) the sends are spread evenly over that time.
+        """
+        compiled = CompiledBroadcast(self.application.bot, text, reply_markup, image, self.media_cache)
+        if chat_ids is None:
+            chat_ids = self.subscribers.copy()
+        checkpoint = self.campaign_store.create(label, compiled, chat_ids, window)
+        return await self.run_campaign(checkpoint, compiled, checkpoint.pending(), progress)
+    
+    async def resume_campaign(self, checkpoint: CampaignCheckpoint) -> Dict[str, int]:
+        """Finish a campaign interrupted by a restart, skipping chats that already got it"""
+        meta = checkpoint.meta
+        compiled = CompiledBroadcast(self.application.bot, meta['text'], meta['reply_markup'], meta['image'], self.media_cache)
+        chat_ids = [chat_id for chat_id in checkpoint.pending() if chat_id in self.subscribers]
+        logger.info(f"Resuming campaign {checkpoint.campaign_id} ({meta['label']}): "
+                    f"{checkpoint.done_count()} of {meta['total']} done, {len(chat_ids)} left")
+        return await self.run_campaign(checkpoint, compiled, chat_ids)
+    
+    async def run_campaign(self, checkpoint: CampaignCheckpoint, compiled: CompiledBroadcast, chat_ids: List[int],
+                           progress: ProgressReporter = None) -> Dict[str, int]:
+        """Deliver a campaign to chat_ids, checkpointing and recording every finished chat"""
+        label = checkpoint.meta['label']
+        ledger_handle = self.ledger.open(checkpoint.campaign_id)
+        sharded = self.sharded_broadcaster and len(chat_ids) >= SHARDED_MIN_SUBSCRIBERS
+        pace = delivery_pace(checkpoint.meta, len(chat_ids))
+        completed = False
+        
+        def on_result(chat_id, outcome, result, latency):
+            checkpoint.mark(chat_id)
+            ledger_handle.write(pack_ledger_record(chat_id, outcome, result, latency))
+            if progress:
+                progress.record(outcome)
+        
+        if progress:
+            progress.start(len(chat_ids), poll=self.ledger.follower(checkpoint.campaign_id) if sharded else None)
+        try:
+            if sharded:
+                results = await self.deliver_sharded(chat_ids, compiled, label, checkpoint, on_result, pace)
+            else:
+                results = await self.broadcast_engine.run(
+                    chat_ids,
+                    compiled.send,
+                    on_blocked=self.pending_removals.add,
+                    on_result=on_result,
+                    label=label,
+                    pace=pace
+                )
+            completed = True
+        except asyncio.CancelledError:
+            job = current_campaign_job.get()
+            if job and job.state == 'cancelled':
+                # Cancelled by an admin rather than interrupted by a shutdown, so it is not resumed
+                checkpoint.remove()
+                self.ledger.finish(checkpoint.meta, {'cancelled': True})
+            raise
+        except BroadcastFormatError as e:
+            checkpoint.remove()
+            self.ledger.finish(checkpoint.meta, {'aborted': str(e)})
+            await self.report_format_error(label, compiled.text, e)
+            raise
+        finally:
+            self.pending_removals.flush()
+            checkpoint.close()
+            ledger_handle.close()
+            if progress:
+                await progress.finish(completed)
+        # An interrupted campaign keeps its checkpoint and is resumed on the next start
+        checkpoint.remove()
+        self.ledger.finish(checkpoint.meta, results)
+        self.storage.record_broadcast(label, results)
+        return results
+    
+    async def deliver_sharded(self, chat_ids: List[int], compiled: CompiledBroadcast, label: str,
+                              checkpoint: CampaignCheckpoint = None, on_result=None,
+                              pace: float = None) -> Dict[str, int]:
+        """Deliver through the worker processes and apply their outcomes in this process"""
+        sharder = self.sharded_broadcaster
+        classifier = self.broadcast_engine.classifier
+        outcomes = await sharder.run(chat_ids, compiled, self.media_cache.file_ids, classifier.strikes, label,
+                                     checkpoint, self.ledger, pace)
+        
+        results = merge_broadcast_results([outcome['results'] for outcome in outcomes])
+        results['blocked_removed'] = 0
+        ran = {outcome['shard'] for outcome in outcomes}
+        classifier.strikes = {
+            chat_id: count for chat_id, count in classifier.strikes.items() if sharder.shard_of(chat_id) not in ran
+        }
+        fallback = []
+        for outcome in outcomes:
+            classifier.counters.update(outcome['results'].get('errors', {}))
+            classifier.strikes.update(outcome['strikes'])
+            if outcome['primary']:
+                results['blocked_removed'] += sum(1 for chat_id in outcome['dropped'] if self.pending_removals.add(chat_id))
+            else:
+                # Other bots may simply not be started by the user, try the main bot before dropping
+                fallback.extend(outcome['dropped'])
+        
+        if fallback:
+            logger.info(f"Retrying {len(fallback)} chats rejected by worker tokens with the main bot")
+            results['failed'] -= len(fallback)
+            fallback_results = await self.broadcast_engine.run(
+                fallback,
+                compiled.send,
+                on_blocked=self.pending_removals.add,
+                on_result=on_result,
+                label=label
+            )
+            results = merge_broadcast_results([results, fallback_results])
+        return results
+    
+    async def deliver_merged(self, parts: List[Dict]) -> List[Dict[str, int]]:
+        """Deliver scheduled broadcasts that fired together in one pass over their chats
+
+        Each chat gets all of its broadcasts in firing order from a single send task, so
+        overlapping campaigns share the concurrency and rate budget instead of competing for
+        it, and chats are taken from the campaigns in turn. Every broadcast keeps its own
+        checkpoint, ledger and history entry and is resumed on its own after a restart.
+        """
+        compiled = [part['compiled'] for part in parts]
+        checkpoints = [part['checkpoint'] for part in parts]
+        targets = [checkpoint.pending() for checkpoint in checkpoints]
+        if len(parts) == 1:
+            return [await self.run_campaign(checkpoints[0], compiled[0], targets[0])]
+        
+        chat_ids = list(dict.fromkeys(chat_id for group in zip_longest(*targets) for chat_id in group
+                                      if chat_id is not None))
+        if self.sharded_broadcaster and len(chat_ids) >= SHARDED_MIN_SUBSCRIBERS:
+            # Worker processes take one campaign at a time
+            all_results = []
+            for checkpoint, part, part_chats in zip(checkpoints, compiled, targets):
+                try:
+                    all_results.append(await self.run_campaign(checkpoint, part, part_chats))
+                except BroadcastFormatError as e:
+                    all_results.append({'aborted': str(e)})
+            return all_results
+        
+        loop = asyncio.get_running_loop()
+        remaining = {}  # chat_id -> deque of the parts still to send it, in firing order
+        for index, part_chats in enumerate(targets):
+            for chat_id in part_chats:
+                remaining.setdefault(chat_id, deque()).append(index)
+        ledger_handles = [self.ledger.open(checkpoint.campaign_id) for checkpoint in checkpoints]
+        tallies = [Counter() for _ in parts]
+        removed = set()
+        
+        def on_blocked(chat_id):
+            if self.pending_removals.add(chat_id):
+                removed.add(chat_id)
+                return True
+            return False
+        
+        def record(index, chat_id, outcome, result, latency):
+            checkpoints[index].mark(chat_id)
+            ledger_handles[index].write(pack_ledger_record(chat_id, outcome, result, latency))
+            tallies[index][outcome] += 1
+        
+        async def send(chat_id):
+            queue = remaining[chat_id]
+            while queue:
+                index = queue[0]
+                started = loop.time()
+                try:
+                    message = await compiled[index].send(chat_id)
+                except BroadcastFormatError:
+                    # This broadcast's message is broken, the others still go out
+                    queue.popleft()
+                    continue
+                except Exception:
+                    tallies[index]['retried'] += 1
+                    raise
+                queue.popleft()
+                record(index, chat_id, 'sent', message, loop.time() - started)
+        
+        def on_result(chat_id, outcome, result, latency):
+            # Sent parts are recorded as they go, a final error applies to every part not sent yet
+            if outcome != 'sent':
+                queue = remaining[chat_id]
+                # The attempt that failed for good was not a retry, its broadcast is the one that removed the chat
+                tallies[queue[0]]['retried'] -= 1
+                if outcome == DROP and chat_id in removed:
+                    tallies[queue[0]]['removed'] += 1
+                while queue:
+                    record(queue.popleft(), chat_id, outcome, result, latency)
+        
+        # The whole pass must finish by the earliest deadline of the merged campaigns
+        paces = [delivery_pace(checkpoint.meta, len(part_chats))
+                 for checkpoint, part_chats in zip(checkpoints, targets)]
+        pace = None
+        if all(paces):
+            pace = len(chat_ids) / min(len(part_chats) / part_pace for part_chats, part_pace in zip(targets, paces))
+        
+        label = f"{len(parts)} merged scheduled broadcasts"
+        try:
+            await self.broadcast_engine.run(
+                chat_ids,
+                send,
+                on_blocked=on_blocked,
+                on_result=on_result,
+                label=label,
+                pace=pace
+            )
+        except asyncio.CancelledError:
+            job = current_campaign_job.get()
+            if job and job.state == 'cancelled':
+                for checkpoint in checkpoints:
+                    checkpoint.remove()
+                    self.ledger.finish(checkpoint.meta, {'cancelled': True})
+            raise
+        finally:
+            self.pending_removals.flush()
+            for checkpoint, handle in zip(checkpoints, ledger_handles):
+                checkpoint.close()
+                handle.close()
+        
+        all_results = []
+        for checkpoint, part, tally in zip(checkpoints, compiled, tallies):
+            if part.format_error:
+                checkpoint.remove()
+                self.ledger.finish(checkpoint.meta, {'aborted': str(part.format_error)})
+                await self.report_format_error(checkpoint.meta['label'], part.text, part.format_error)
+                all_results.append({'aborted': str(part.format_error)})
+                continue
+            failed = sum(count for outcome, count in tally.items() if outcome not in ('sent', 'retried', 'removed'))
+            results = {
+                'success': tally['sent'],
+                'failed': failed,
+                'blocked_removed': tally['removed'],
+                'retried': tally['retried'],
+                'quarantined': tally[QUARANTINE],
+                'errors': {},
+                'merged': len(parts)
+            }
+            checkpoint.remove()
+            self.ledger.finish(checkpoint.meta, results)
+            self.storage.record_broadcast(checkpoint.meta['label'], results)
+            all_results.append(results)
+        return all_results
+    
+    async def report_format_error(self, label: str, text: str, error: BroadcastFormatError):
+        """Tell the admins a broadcast was not sent because Telegram rejected its Markdown"""
+        report = (f"❌ {label.capitalize()} was not sent: Telegram could not parse its formatting ({error}).\n\n"
+                  f"Fix the Markdown and send it again:\n\n{text[:1000]}")
+        for admin_id in self.admin_ids:
+            try:
+                await self.application.bot.send_message(chat_id=admin_id, text=report)
+            except TelegramError as e:
+                logger.error(f"Could not tell admin {admin_id} about the rejected broadcast: {e}")
+    
+    async def broadcast_to_all(self, message: str, message_type: str = "scheduled",
+                               progress: ProgressReporter = None, chat_ids: List[int] = None,
+                               window: float = None) -> Dict[str, int]:
+        """Broadcast message to all subscribers (or just chat_ids)"""
+        formatted_message, reply_markup = self.format_scheduled_message(message)
+        return await self.deliver_broadcast(formatted_message, reply_markup, label=f"{message_type} broadcast",
+                                            progress=progress, chat_ids=chat_ids, window=window)
+    
+    def format_scheduled_message(self, message: str):
+        """Text and buttons a plain scheduled broadcast goes out with"""
         # Add scheduling info to message
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         formatted_message = f"""
@@ -295,64 +2921,166 @@ Ready to start earning? Let's grow! 💎
             [InlineKeyboardButton("📞 Contact", url="https://t.me/LetsGrowCS")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        for chat_id in self.subscribers.copy():
-            try:
-                await self.application.bot.send_message(
-                    chat_id=chat_id,
-                    text=formatted_message,
-                    parse_mode=ParseMode.MARKDOWN,
-                    reply_markup=reply_markup
-                )
-                success_count += 1
-                await asyncio.sleep(0.05)  # Rate limiting
-                
-            except Exception as e:
-                failed_count += 1
-                blocked_users.append(chat_id)
-                if "blocked" in str(e).lower() or "not found" in str(e).lower():
-                    self.remove_subscriber(chat_id)
-                logger.warning(f"Failed to send to {chat_id}: {e}")
-        
-        # Log broadcast results
-        logger.info(f"Broadcast complete: {success_count} sent, {failed_count} failed")
-        
-        return {
-            'success': success_count,
-            'failed': failed_count,
-            'blocked_removed': len(blocked_users)
-        }
+        return formatted_message, reply_markup
     
     def setup_scheduler(self):
         """Setup scheduled broadcasts"""
         for msg in self.scheduled_messages:
-            if msg['active']:
-                if msg['type'] == 'daily':
-                    schedule.every().day.at(msg['time']).do(
-                        self.run_scheduled_broadcast, 
-                        msg['message']
-                    )
-                    logger.info(f"Scheduled daily broadcast at {msg['time']}")
+            if self.schedule_entry(msg, catch_up=True):
+                logger.info(f"Scheduled {msg['type']} broadcast at {msg['time']}")
         
-        # Setup weekly summary (every Sunday at 10:00)
-        schedule.every().sunday.at("10:00").do(
-            self.run_scheduled_broadcast,
-            self.get_weekly_summary_message()
-        )
+        # Setup weekly summary (every Sunday at 10:00 UTC)
+        self.scheduler.recurring(Recurrence("sun 10:00", 'UTC'), self.send_weekly_summary)
         
-        # Setup monthly stats (1st of month at 09:00)  
-        schedule.every().day.at("09:00").do(self.check_monthly_broadcast)
+        # Setup monthly stats (1st of month at 09:00 UTC, alongside schedule entries at that time)
+        self.scheduler.recurring(Recurrence("monthly 1 09:00", 'UTC'), self.check_monthly_broadcast)
+        
+        # Reload one-time broadcasts, catching up on the ones missed while we were down
+        now = datetime.utcnow()
+        for broadcast in self.one_time_broadcasts:
+            if now - broadcast['datetime'] > timedelta(minutes=ONE_TIME_CATCHUP_MINUTES):
+                logger.warning(f"Skipping one-time broadcast missed at {broadcast['datetime']} UTC")
+                self.one_time_broadcasts.mark(broadcast, 'missed')
+            else:
+                if broadcast['datetime'] < now:
+                    logger.info(f"Catching up on one-time broadcast missed at {broadcast['datetime']} UTC")
+                self.schedule_one_time_job(broadcast)
+    
+    def schedule_entry(self, msg: Dict, catch_up: bool = False) -> bool:
+        """(Re)register a schedule entry with the scheduler, replacing any job it already had
+
+        With catch_up (at startup) a run missed since the entry last fired is due at
+        once and handled by the misfire policy.
+        """
+        self.unschedule_entry(msg['id'])
+        if not msg.get('active', True) or msg.get('type') not in ('daily', 'custom'):
+            return False
+        try:
+            recurrence = self.entry_recurrence(msg)
+        except ValueError as e:
+            logger.error(f"Schedule {msg['id']} has an invalid rule: {e}")
+            return False
+        
+        if msg.get('delivery') != 'local':
+            last_run = None
+            if catch_up and msg.get('last_fired'):
+                last_run = datetime.fromisoformat(msg['last_fired'])
+            self.schedule_jobs[msg['id']] = [self.scheduler.recurring(
+                recurrence, self.fire_schedule_entry, msg['id'], name=f"schedule {msg['id']}", last_run=last_run
+            )]
+            return True
+        
+        # Local-time delivery: the rule fires separately in every subscriber timezone
+        jobs = []
+        zone_last_fired = msg.get('zone_last_fired', {})
+        for zone in self.delivery_zones(msg):
+            try:
+                zone_recurrence = Recurrence(recurrence.spec, zone)
+            except ValueError as e:
+                logger.error(f"Schedule {msg['id']} skips subscribers in {zone}: {e}")
+                continue
+            last_run = None
+            if catch_up and zone_last_fired.get(zone):
+                last_run = datetime.fromisoformat(zone_last_fired[zone])
+            jobs.append(self.scheduler.recurring(
+                zone_recurrence, self.fire_schedule_entry, msg['id'], zone,
+                name=f"schedule {msg['id']} ({zone})", last_run=last_run
+            ))
+        self.schedule_jobs[msg['id']] = jobs
+        return True
+    
+    def delivery_zones(self, msg: Dict) -> List[str]:
+        """Timezone buckets of a local-time entry: its own zone (subscribers without one) plus every picked zone"""
+        return sorted({msg.get('timezone', 'UTC'), *self.picked_timezones()})
+    
+    def picked_timezones(self) -> set:
+        """Zones current subscribers picked with /timezone"""
+        return {zone for chat_id, zone in self.subscriber_timezones.items() if chat_id in self.subscribers}
+    
+    def zone_subscribers(self, msg: Dict, zone: str) -> List[int]:
+        """Subscribers in one timezone bucket of a local-time entry"""
+        default = msg.get('timezone', 'UTC')
+        timezones = self.subscriber_timezones
+        return [chat_id for chat_id in self.subscribers if timezones.get(chat_id, default) == zone]
+    
+    def get_entry_next_run(self, msg: Dict) -> str:
+        """When the scheduler will next fire a schedule entry"""
+        runs = [job.next_run for job in self.schedule_jobs.get(msg['id'], []) if job.next_run is not None]
+        if not runs:
+            return "Not scheduled"
+        return min(runs).strftime('%Y-%m-%d %H:%M UTC')
     
-    def run_scheduled_broadcast(self, message: str):
-        """Run scheduled broadcast in async context"""
+    @staticmethod
+    def window_label(msg: Dict) -> str:
+        """Suffix describing a schedule entry's delivery window, empty when it sends at full speed"""
+        if not msg.get('window'):
+            return ""
+        return f", spread over {msg['window']:g} min"
+    
+    @staticmethod
+    def entry_recurrence(msg: Dict) -> Recurrence:
+        """Recurrence of a schedule entry, entries without a rule fire daily at their UTC time"""
+        if msg.get('rule'):
+            return Recurrence(msg['rule'], msg.get('timezone', 'UTC'))
+        return Recurrence(msg['time'], 'UTC')
+    
+    def unschedule_entry(self, broadcast_id: int):
+        """Cancel the scheduler jobs of a schedule entry, if it has any"""
+        for job in self.schedule_jobs.pop(broadcast_id, []):
+            self.scheduler.cancel(job)
+    
+    async def fire_schedule_entry(self, broadcast_id: int, zone: str = None):
+        """Send a schedule entry as currently stored, so edits made since it was scheduled apply
+
+        For local-time entries only the subscribers in the given timezone bucket get it.
+        """
+        msg = next((m for m in self.scheduled_messages if m['id'] == broadcast_id), None)
+        if msg is None or not msg.get('active', True):
+            return
+        chat_ids = self.zone_subscribers(msg, zone) if zone is not None else None
+        if chat_ids is not None and not chat_ids:
+            # Nobody left in this timezone bucket: no campaign, and no run to resume or catch up on
+            return
+        part = None
         if self.application:
-            asyncio.create_task(self.broadcast_to_all(message, "scheduled"))
+            if msg['type'] == 'daily':
+                text, reply_markup = self.format_scheduled_message(msg['message'])
+                part = self.scheduled_part("scheduled broadcast", text, reply_markup, None, chat_ids, msg.get('window'))
+            else:
+                part = self.scheduled_part("custom scheduled broadcast", msg['message'],
+                                           self.custom_broadcast_markup(msg), msg.get('image'), chat_ids,
+                                           msg.get('window'))
+        # Recorded once the run is checkpointed, so a restart resumes it instead of repeating or missing it
+        fired_at = datetime.now(timezone.utc).isoformat()
+        if zone is None:
+            msg['last_fired'] = fired_at
+        else:
+            msg.setdefault('zone_last_fired', {})[zone] = fired_at
+        self.save_scheduled_messages()
+        if part:
+            await self.merger.add(part)
+    
+    def scheduled_part(self, label: str, text: str, reply_markup, image: Optional[str],
+                       chat_ids: Optional[List[int]], window: float = None) -> Dict:
+        """Compile and checkpoint a scheduled broadcast as it fires, before it waits to be merged and delivered"""
+        compiled = CompiledBroadcast(self.application.bot, text, reply_markup, image, self.media_cache)
+        if chat_ids is None:
+            chat_ids = self.subscribers.copy()
+        checkpoint = self.campaign_store.create(label, compiled, chat_ids, window)
+        return {'label': label, 'compiled': compiled, 'checkpoint': checkpoint}
     
-    def check_monthly_broadcast(self):
+    async def run_scheduled_broadcast(self, message: str):
+        """Run scheduled broadcast"""
+        if self.application:
+            text, reply_markup = self.format_scheduled_message(message)
+            await self.merger.add(self.scheduled_part("scheduled broadcast", text, reply_markup, None, None))
+    
+    async def check_monthly_broadcast(self):
         """Check if today is first of month for monthly broadcast"""
-        if datetime.now().day == 1:
+        now = datetime.now(timezone.utc)
+        if now.day == 1:
             monthly_message = f"""
-📊 *Monthly Report - {datetime.now().strftime('%B %Y')}*
+📊 *Monthly Report - {now.strftime('%B %Y')}*
 
 🎉 Thank you for being part of our community!
 
@@ -368,12 +3096,16 @@ Ready to start earning? Let's grow! 💎
 
 Stay tuned for amazing updates! 🌟
             """
-            self.run_scheduled_broadcast(monthly_message)
+            await self.run_scheduled_broadcast(monthly_message)
+    
+    async def send_weekly_summary(self):
+        """Send the weekly summary, built when it goes out so the numbers are current"""
+        await self.run_scheduled_broadcast(self.get_weekly_summary_message())
     
     def get_weekly_summary_message(self) -> str:
         """Generate weekly summary message"""
         return f"""
-📊 *Weekly Summary - {datetime.now().strftime('%B %d, %Y')}*
+📊 *Weekly Summary - {datetime.now(timezone.utc).strftime('%B %d, %Y')}*
 
 🎉 Another great week with our community!
 
@@ -416,7 +3148,7 @@ Have a wonderful week ahead! 🌟
             time.fromisoformat(time_str + ":00")
             
             new_schedule = {
-                "id": len(self.scheduled_messages) + 1,
+                "id": self.next_schedule_id(),
                 "time": time_str,
                 "message": message,
                 "active": True,
@@ -427,10 +3159,7 @@ Have a wonderful week ahead! 🌟
             self.save_scheduled_messages()
             
             # Add to scheduler
-            schedule.every().day.at(time_str).do(
-                self.run_scheduled_broadcast, 
-                message
-            )
+            self.schedule_entry(new_schedule)
             
             await update.message.reply_text(
                 f"✅ *Schedule Added Successfully!*\n\n"
@@ -463,11 +3192,13 @@ Have a wonderful week ahead! 🌟
             return
         
         message = " ".join(context.args)
-        await update.message.reply_text("📤 Starting broadcast...")
-        
-        results = await self.broadcast_to_all(message, "manual")
+        progress_message = await update.message.reply_text("📤 Starting broadcast...")
+        progress = ProgressReporter(progress_message, "manual")
         
-        result_message = f"""
+        async def run_broadcast():
+            results = await self.broadcast_to_all(message, "manual", progress=progress)
+            
+            result_message = f"""
 ✅ *Manual Broadcast Complete!*
 
 📊 *Results:*
@@ -475,9 +3206,12 @@ Have a wonderful week ahead! 🌟
 ❌ Failed: {results['failed']}
 🚫 Blocked users removed: {results['blocked_removed']}
 👥 Total active subscribers: {len(self.subscribers)}
-        """
+            """
+            
+            await update.message.reply_text(result_message, parse_mode=ParseMode.MARKDOWN)
         
-        await update.message.reply_text(result_message, parse_mode=ParseMode.MARKDOWN)
+        # Runs in the background, the handler returns right away
+        await self.start_campaign_job(run_broadcast(), "manual broadcast", progress)
     
     async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show detailed statistics (Admin only)"""
@@ -492,6 +3226,10 @@ Have a wonderful week ahead! 🌟
         
         active_schedules = len([m for m in self.scheduled_messages if m['active']])
         next_broadcast = self.get_next_broadcast_time()
+        error_counters = self.broadcast_engine.classifier.counters
+        error_summary = "\n".join(
+            f"• {name.replace('_', ' ').capitalize()}: {count}" for name, count in error_counters.most_common()
+        ) or "• None since start"
         
         stats_message = f"""
 📊 *Admin Statistics Dashboard*
@@ -516,6 +3254,10 @@ Have a wonderful week ahead! 🌟
 • Uptime: Running continuously
 • Features: All operational
 
+⚠️ *Delivery Errors:*
+{error_summary}
+• Quarantined chats: {len(self.broadcast_engine.classifier.strikes)}
+
 📅 *Schedule Overview:*
         """
         
@@ -525,141 +3267,226 @@ Have a wonderful week ahead! 🌟
         
         await update.message.reply_text(stats_message, parse_mode=ParseMode.MARKDOWN)
     
-    def run_scheduler(self):
-        """Run scheduler in separate thread"""
-        while True:
-            schedule.run_pending()
-            # Check for one-time broadcasts
-            self.check_one_time_broadcasts()
-            threading.Event().wait(30)  # Check every 30 seconds
-    
-    def check_one_time_broadcasts(self):
-        """Check and execute one-time broadcasts"""
-        if not hasattr(self, 'one_time_broadcasts'):
+    def schedule_one_time_job(self, broadcast):
+        """Register a stored one-time broadcast with the scheduler"""
+        when = broadcast['datetime'].replace(tzinfo=timezone.utc)
+        self.scheduler.at(when, self.fire_one_time_broadcast, broadcast, name=f"one-time {broadcast['id']}",
+                          policy=FIRE_LATE, grace=ONE_TIME_CATCHUP_MINUTES * 60,
+                          on_skip=self.skip_one_time_broadcast)
+    
+    def fire_one_time_broadcast(self, broadcast):
+        """Execute a due one-time broadcast exactly once"""
+        if broadcast['status'] != 'pending':
             return
-        
-        # Use UTC time for consistency
-        now = datetime.utcnow()
-        broadcasts_to_remove = []
-        
-        for i, broadcast in enumerate(self.one_time_broadcasts):
-            target_time = broadcast['datetime']
-            
-            # Debug output
-            time_diff = (target_time - now).total_seconds()
-            if abs(time_diff) <= 120:  # Only show debug for broadcasts within 2 minutes
-                print(f"DEBUG: One-time broadcast check - Target: {target_time}, Now: {now}, Diff: {time_diff}s")
-            
-            # Check if it's time to send (within 2 minute window for safety)
-            if now >= target_time and now <= target_time + timedelta(minutes=2):
-                print(f"Executing one-time broadcast scheduled for {target_time}")
-                # Execute the broadcast using the existing method
-                if self.application:
-                    # Schedule the broadcast using the same pattern as regular scheduled broadcasts
-                    import threading
-                    broadcast_thread = threading.Thread(
-                        target=self.run_one_time_broadcast_sync,
-                        args=(broadcast,)
-                    )
-                    broadcast_thread.start()
-                broadcasts_to_remove.append(i)
-            # Remove broadcasts that are more than 1 hour past due
-            elif now > target_time + timedelta(hours=1):
-                print(f"Removing expired one-time broadcast: {target_time}")
-                broadcasts_to_remove.append(i)
-        
-        # Remove executed/expired broadcasts
-        for i in reversed(broadcasts_to_remove):
-            del self.one_time_broadcasts[i]
-    
-    async def send_one_time_broadcast(self, broadcast_data):
+        print(f"Executing one-time broadcast scheduled for {broadcast['datetime']}")
+        if self.application:
+            # Checkpoint before marking it fired: a restart while it waits for a slot resumes
+            # the campaign, and once marked it can't be sent a second time
+            compiled = CompiledBroadcast(self.application.bot, broadcast['message'],
+                                         self.custom_broadcast_markup(broadcast), broadcast.get('image'),
+                                         self.media_cache)
+            checkpoint = self.campaign_store.create("one-time broadcast", compiled, self.subscribers.copy())
+            self.one_time_broadcasts.mark(broadcast, 'fired')
+            self.campaigns.submit(self.send_one_time_broadcast(checkpoint, compiled), name="one-time broadcast",
+                                  on_discard=checkpoint.remove)
+        else:
+            self.one_time_broadcasts.mark(broadcast, 'fired')
+    
+    def skip_one_time_broadcast(self, broadcast):
+        """Record a one-time broadcast the scheduler found too late to send"""
+        if broadcast['status'] == 'pending':
+            self.one_time_broadcasts.mark(broadcast, 'missed')
+    
+    async def send_one_time_broadcast(self, checkpoint: CampaignCheckpoint, compiled: CompiledBroadcast):
         """Send one-time scheduled broadcast"""
-        print(f"Sending one-time broadcast: {broadcast_data['message'][:50]}...")
+        print(f"Sending one-time broadcast: {compiled.text[:50]}...")
+        
+        results = await self.run_campaign(checkpoint, compiled, checkpoint.pending())
+        
+        print(f"One-time broadcast completed: {results['success']} sent, {results['failed']} failed")
+    
+    async def start_campaign_job(self, coro, name: str, progress: ProgressReporter = None) -> CampaignJob:
+        """Run an admin-started campaign as a background job, telling the admin if it has to wait for a slot"""
+        job = self.campaigns.submit(coro, name=name, progress=progress)
+        if progress and len(self.campaigns.active()) > self.campaigns.max_concurrent:
+            await progress.update(
+                f"🕒 *Queued* ({name})\n\n{self.campaigns.max_concurrent} campaigns are already running, "
+                f"this one starts when a slot frees up.",
+                InlineKeyboardMarkup([[InlineKeyboardButton("⛔ Cancel", callback_data=f"job_cancel_{job.job_id}")]])
+            )
+        return job
+    
+    async def jobs_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show running and queued campaigns with their controls (Admin only)"""
+        user_id = update.effective_user.id
+        
+        if not self.is_admin(user_id):
+            await update.message.reply_text("❌ Only admin can view campaign jobs.")
+            return
+        
+        jobs = self.campaigns.active()
+        if not jobs:
+            await update.message.reply_text("📭 No campaigns are running.")
+            return
         
-        # Create keyboard
+        states = {'queued': "🕒 Queued", 'running': "📤 Running", 'paused': "⏸ Paused"}
+        jobs_text = f"⚙️ *Campaign Jobs* ({self.campaigns.max_concurrent} run at a time)\n\n"
         keyboard = []
-        for button in broadcast_data.get('buttons', []):
-            if 'url' in button:
-                keyboard.append([InlineKeyboardButton(button['text'], url=button['url'])])
-            else:
-                keyboard.append([InlineKeyboardButton(button['text'], callback_data=button['callback_data'])])
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        for job in jobs:
+            jobs_text += f"*#{job.job_id}* {job.name.title()} - {states.get(job.state, job.state)}"
+            jobs_text += f" (since {job.created_at.strftime('%H:%M')})\n"
+            row = []
+            if job.state == 'running':
+                row.append(InlineKeyboardButton(f"⏸ Pause #{job.job_id}", callback_data=f"job_pause_{job.job_id}"))
+            elif job.state == 'paused':
+                row.append(InlineKeyboardButton(f"▶️ Resume #{job.job_id}", callback_data=f"job_resume_{job.job_id}"))
+            row.append(InlineKeyboardButton(f"⛔ Cancel #{job.job_id}", callback_data=f"job_cancel_{job.job_id}"))
+            keyboard.append(row)
+        
+        await update.message.reply_text(jobs_text, parse_mode=ParseMode.MARKDOWN, reply_markup=InlineKeyboardMarkup(keyboard))
+    
+    async def campaigns_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show delivery results of recent campaigns from the ledger (Admin only)"""
+        user_id = update.effective_user.id
         
-        success_count = 0
-        failed_count = 0
+        if not self.is_admin(user_id):
+            await update.message.reply_text("❌ Only admin can view campaigns.")
+            return
         
-        for chat_id in self.subscribers.copy():
-            try:
-                if broadcast_data.get('image') and os.path.exists(broadcast_data['image']):
-                    with open(broadcast_data['image'], 'rb') as photo:
-                        await self.application.bot.send_photo(
-                            chat_id=chat_id,
-                            photo=photo,
-                            caption=broadcast_data['message'],
-                            parse_mode=ParseMode.MARKDOWN,
-                            reply_markup=reply_markup
-                        )
-                else:
-                    await self.application.bot.send_message(
-                        chat_id=chat_id,
-                        text=broadcast_data['message'],
-                        parse_mode=ParseMode.MARKDOWN,
-                        reply_markup=reply_markup
-                    )
-                success_count += 1
-                await asyncio.sleep(0.05)
-                
-            except Exception as e:
-                failed_count += 1
-                if "blocked" in str(e).lower() or "not found" in str(e).lower():
-                    self.remove_subscriber(chat_id)
-                logger.warning(f"Failed to send one-time broadcast to {chat_id}: {e}")
+        if context.args:
+            entry = self.ledger.campaign(context.args[0])
+            if not entry:
+                await update.message.reply_text("❌ Campaign not found.")
+                return
+            entries = [entry]
+        else:
+            entries = self.ledger.campaigns()[-5:]
+            if not entries:
+                await update.message.reply_text("📭 No finished campaigns yet.")
+                return
+        
+        campaigns_text = "📦 *Recent Campaigns:*\n\n"
+        for entry in reversed(entries):
+            summary = self.ledger.summary(entry['campaign_id'])
+            outcomes = summary['outcomes']
+            campaigns_text += f"*{entry['label'].title()}* - `{entry['campaign_id']}`\n"
+            campaigns_text += f"   ✅ Sent: {outcomes.get('sent', 0)}"
+            campaigns_text += f" | 🚫 Dropped: {outcomes.get(DROP, 0)}"
+            campaigns_text += f" | ⏸ Quarantined: {outcomes.get(QUARANTINE, 0)}"
+            campaigns_text += f" | ❌ Failed: {outcomes.get(FAIL, 0)}\n"
+            if summary['latency_p50_ms'] is not None:
+                campaigns_text += f"   ⏱ Latency: {summary['latency_p50_ms']} ms median, {summary['latency_p95_ms']} ms p95\n"
+            campaigns_text += f"   🕒 Finished: {entry['finished_at'][:16].replace('T', ' ')}\n\n"
+        
+        reply_markup = None
+        if len(entries) == 1 and self.ledger.is_ambiguous(entries[0]['campaign_id']):
+            campaigns_text += AMBIGUOUS_CAMPAIGN_TEXT
+        elif len(entries) == 1:
+            campaign_id = entries[0]['campaign_id']
+            reply_markup = InlineKeyboardMarkup([
+                [InlineKeyboardButton("✏️ Edit Everywhere", callback_data=f"campaign_edit_{campaign_id}"),
+                 InlineKeyboardButton("🗑️ Recall", callback_data=f"campaign_recall_{campaign_id}")]
+            ])
+        else:
+            campaigns_text += "Use /campaigns <id> to edit or recall a campaign."
         
-        logger.info(f"One-time broadcast sent: {success_count} success, {failed_count} failed")
-        print(f"One-time broadcast completed: {success_count} sent, {failed_count} failed")
+        await update.message.reply_text(campaigns_text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
     
-    def run_one_time_broadcast_sync(self, broadcast_data):
-        """Run one-time broadcast in sync context (for threading)"""
-        try:
-            # Create a simple broadcast message
-            message = broadcast_data['message']
-            
-            # Add timestamp to message
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            formatted_message = f"""
-{message}
+    async def apply_to_delivered(self, campaign_id: str, action, label: str,
+                                 progress: ProgressReporter = None) -> Dict[str, int]:
+        """Call action(bot, chat_id, message_id) for every message a campaign delivered, through the broadcast engine
 
-🤖 *One-time Broadcast*
-🕒 {timestamp}
-            """
-            
-            # Create keyboard
-            keyboard_data = []
-            for button in broadcast_data.get('buttons', []):
-                if 'url' in button:
-                    keyboard_data.append({'text': button['text'], 'url': button['url']})
-                else:
-                    keyboard_data.append({'text': button['text'], 'callback_data': button['callback_data']})
-            
-            # Use the existing broadcast method by temporarily storing the data
-            temp_data = {
-                'message': formatted_message,
-                'image': broadcast_data.get('image'),
-                'buttons': keyboard_data
-            }
-            
-            # Send using asyncio in a new event loop
-            import asyncio
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+        Each message is handled by the bot that sent it, messages of a worker token that is no
+        longer configured are skipped. Failures never unsubscribe or quarantine anyone.
+        """
+        entry = self.ledger.campaign(campaign_id) or {}
+        senders = entry.get('senders', {})
+        main_id = bot_id_of(self.bot_token)
+        tokens = self.sharded_broadcaster.tokens if self.sharded_broadcaster else [self.bot_token]
+        tokens = {bot_id_of(token): token for token in tokens}
+        targets = {}  # chat_id -> (sending bot id, message_id)
+        skipped = 0
+        for chat_id, message_id, shard in self.ledger.delivered(campaign_id):
+            if shard is None:
+                sender = main_id
+            elif str(shard) in senders:
+                sender = senders[str(shard)]
+            else:
+                # Campaigns from before senders were recorded
+                sender = bot_id_of(self.sharded_broadcaster.token_of(shard)) if self.sharded_broadcaster else main_id
+            if sender in tokens:
+                targets[chat_id] = (sender, message_id)
+            else:
+                skipped += 1
+        if skipped:
+            logger.warning(f"Skipping {skipped} chats of campaign {campaign_id}: sent by a bot token that is no longer configured")
+        
+        bots = {main_id: self.application.bot}
+        for sender in {sender for sender, _ in targets.values()} - {main_id}:
+            bots[sender] = ExtBot(tokens[sender], rate_limiter=TelegramRateLimiter())
+        # Its own classifier, so failures here don't count as strikes against subscribers
+        engine = BroadcastEngine(classifier=DeliveryErrorClassifier())
+        completed = False
+        
+        async def send(chat_id):
+            sender, message_id = targets[chat_id]
             try:
-                loop.run_until_complete(self.send_one_time_broadcast(broadcast_data))
-            finally:
-                loop.close()
-                
-        except Exception as e:
-            logger.error(f"Error in one-time broadcast: {e}")
-            print(f"Error in one-time broadcast: {e}")
+                return await action(bots[sender], chat_id, message_id)
+            except BadRequest as e:
+                # Already in the wanted state, nothing to do
+                if "message is not modified" in e.message.lower():
+                    return None
+                raise
+        
+        if progress:
+            progress.start(len(targets))
+        try:
+            for sender, bot in bots.items():
+                if sender != main_id:
+                    await bot.initialize()
+            results = await engine.run(
+                list(targets),
+                send,
+                on_result=(lambda chat_id, outcome, result, latency: progress.record(outcome)) if progress else None,
+                label=label
+            )
+            completed = True
+        finally:
+            for sender, bot in bots.items():
+                if sender != main_id:
+                    await bot.shutdown()
+            if progress:
+                await progress.finish(completed)
+        results['skipped'] = skipped
+        return results
+    
+    async def edit_sent_campaign(self, campaign_id: str, text: str, progress: ProgressReporter = None) -> Dict[str, int]:
+        """Replace the text (or caption) of a delivered campaign in every chat, keeping its buttons"""
+        entry = self.ledger.campaign(campaign_id)
+        api_kwargs = {'reply_markup': entry['reply_markup']} if entry.get('reply_markup') else None
+        
+        if entry.get('image'):
+            def action(bot, chat_id, message_id):
+                return bot.edit_message_caption(chat_id=chat_id, message_id=message_id, caption=text,
+                                                parse_mode=ParseMode.MARKDOWN, api_kwargs=api_kwargs,
+                                                rate_limit_args=PRIORITY_BULK)
+        else:
+            def action(bot, chat_id, message_id):
+                return bot.edit_message_text(text, chat_id=chat_id, message_id=message_id,
+                                             parse_mode=ParseMode.MARKDOWN, api_kwargs=api_kwargs,
+                                             rate_limit_args=PRIORITY_BULK)
+        
+        return await self.apply_to_delivered(campaign_id, action, f"edit of campaign {campaign_id}", progress)
+    
+    async def recall_campaign(self, campaign_id: str, progress: ProgressReporter = None) -> Dict[str, int]:
+        """Delete a delivered campaign from every chat"""
+        return await self.apply_to_delivered(
+            campaign_id,
+            lambda bot, chat_id, message_id: bot.delete_message(chat_id=chat_id, message_id=message_id,
+                                                                rate_limit_args=PRIORITY_BULK),
+            f"recall of campaign {campaign_id}",
+            progress
+        )
     
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show help message"""
@@ -670,12 +3497,15 @@ Have a wonderful week ahead! 🌟
 /start - Subscribe to earning updates
 /stop - Unsubscribe from updates
 /schedule - View earning schedule
+/timezone <zone> - Get scheduled updates at your local time
 /help - Show this help
 
 *Admin Commands:*
 /broadcast <message> - Send immediate broadcast
 /addschedule <time> <message> - Add scheduled broadcast
 /stats - View detailed statistics
+/campaigns [id] - Delivery results of recent campaigns
+/jobs - Pause, resume or cancel running campaigns
 
 *Features:*
 ⏰ Daily earning opportunities
@@ -919,8 +3749,9 @@ Example: "🚀 New earning opportunity is here! Start now and earn rewards!"
             
             try:
                 if random_image and os.path.exists(random_image):
-                    with open(random_image, 'rb') as photo:
-                        await query.edit_message_media(
+                    await self.media_cache.send(
+                        random_image,
+                        lambda photo: query.edit_message_media(
                             media=telegram.InputMediaPhoto(
                                 media=photo,
                                 caption=broadcast_text,
@@ -928,6 +3759,7 @@ Example: "🚀 New earning opportunity is here! Start now and earn rewards!"
                             ),
                             reply_markup=reply_markup
                         )
+                    )
                 else:
                     await query.edit_message_text(
                         broadcast_text,
@@ -955,7 +3787,7 @@ Example: "🚀 New earning opportunity is here! Start now and earn rewards!"
             else:
                 # Group broadcasts by type
                 daily_broadcasts = [msg for msg in self.scheduled_messages if msg.get('type') in ['daily', 'custom'] and msg.get('active', True)]
-                one_time_broadcasts = getattr(self, 'one_time_broadcasts', [])
+                one_time_broadcasts = list(self.one_time_broadcasts)
                 
                 if daily_broadcasts:
                     broadcast_text += "🔁 *Daily Broadcasts:*\n"
@@ -1137,6 +3969,14 @@ Ready to start earning? Let's grow! 💎
             # Schedule for daily
             await self.schedule_broadcast_daily(query, user_id)
         
+        elif query.data == "frequency_local":
+            if not self.is_admin(user_id):
+                await query.edit_message_text("❌ Access Denied")
+                return
+            
+            # Schedule for daily, sent per subscriber timezone
+            await self.schedule_broadcast_daily(query, user_id, local=True)
+        
         elif query.data.startswith("edit_broadcast_"):
             if not self.is_admin(user_id):
                 await query.edit_message_text("❌ Access Denied")
@@ -1193,12 +4033,13 @@ Ready to start earning? Let's grow! 💎
 🌍 *Enter New Time with Timezone:*
 Please enter the new time in timezone format.
 
-🕒 *Format: UTC[+/-offset] HH:MM*
+🕒 *Format: <timezone> <schedule>*
 Examples:
 • `UTC+5:30 19:48` (India)
-• `UTC+6 14:30` (Bangladesh)
-• `UTC-5 09:15` (US Eastern)
-• `UTC+0 13:45` (London/UTC)
+• `Asia/Dhaka 14:30` (Bangladesh)
+• `America/New_York 09:15` (US Eastern, follows DST)
+• `Europe/London mon-fri 13:45` (weekdays)
+• `UTC monthly 1 09:00` (1st of every month)
 
 Type your new time:
             """
@@ -1257,6 +4098,42 @@ Type your new broadcast message and send it.
                 reply_markup=reply_markup
             )
         
+        elif query.data.startswith("edit_window_"):
+            if not self.is_admin(user_id):
+                await query.edit_message_text("❌ Access Denied")
+                return
+            
+            broadcast_id = int(query.data.split("_")[2])
+            broadcast = next((msg for msg in self.scheduled_messages if msg['id'] == broadcast_id), None)
+            if not broadcast:
+                await query.edit_message_text("❌ Broadcast not found.")
+                return
+            
+            self.broadcast_states[user_id] = f'editing_window_{broadcast_id}'
+            current = f"{broadcast['window']:g} minutes" if broadcast.get('window') else "off, sent all at once"
+            edit_text = f"""
+⏳ *Spread Delivery*
+
+📋 **Current:** {current}
+👥 **Recipients:** {len(self.subscribers)} subscribers
+
+✏️ *Enter the minutes to spread each run over:*
+Sends are paced evenly across that time so broadcasts scheduled close together don't compete for the rate limit.
+
+Send `0` to send as fast as possible again.
+            """
+            
+            keyboard = [
+                [InlineKeyboardButton("❌ Cancel", callback_data=f"edit_broadcast_{broadcast_id}")]
+            ]
+            reply_markup = InlineKeyboardMarkup(keyboard)
+            
+            await query.edit_message_text(
+                edit_text,
+                parse_mode=ParseMode.MARKDOWN,
+                reply_markup=reply_markup
+            )
+        
         elif query.data.startswith("edit_buttons_"):
             if not self.is_admin(user_id):
                 await query.edit_message_text("❌ Access Denied")
@@ -1358,17 +4235,18 @@ Type your new broadcast message and send it.
 🌍 *Step: Set Time with Timezone*
 Please enter your timezone and time.
 
-🕒 *Format: UTC[+/-offset] HH:MM*
+🕒 *Format: <timezone> <schedule>*
 Examples:
 • `UTC+5:30 19:48` (India)
-• `UTC+6 19:48` (Bangladesh)
-• `UTC-5 14:30` (US Eastern)
-• `UTC+0 13:45` (London/UTC)
-• `UTC+8 21:00` (China/Singapore)
+• `Asia/Dhaka 19:48` (Bangladesh)
+• `America/New_York 14:30` (US Eastern, follows DST)
+• `Europe/London mon-fri 13:45` (weekdays)
+• `Asia/Singapore monthly 1,15 21:00` (twice a month)
+• `UTC 30 9 * * 1-5` (cron)
 
 ⏰ *Current UTC Time:* {current_utc_time}
 
-📝 *Your input will be converted to UTC automatically.*
+📝 *Timezones with daylight saving time are followed automatically.*
 
 Type your timezone and time:
             """
@@ -1416,64 +4294,136 @@ Type your timezone and time:
                 keyboard.append([InlineKeyboardButton(button['text'], url=button['url'])])
             reply_markup = InlineKeyboardMarkup(keyboard)
             
-            # Send broadcast to all subscribers
-            success_count = 0
-            failed_count = 0
+            # Clear broadcast state
+            if user_id in self.broadcast_states:
+                del self.broadcast_states[user_id]
+            if user_id in self.temp_broadcast_data:
+                del self.temp_broadcast_data[user_id]
             
-            for chat_id in self.subscribers.copy():
-                try:
-                    if data['image'] and os.path.exists(data['image']):
-                        with open(data['image'], 'rb') as photo:
-                            await self.application.bot.send_photo(
-                                chat_id=chat_id,
-                                photo=photo,
-                                caption=data['text'],
-                                parse_mode=ParseMode.MARKDOWN,
-                                reply_markup=reply_markup
-                            )
-                    else:
-                        await self.application.bot.send_message(
-                            chat_id=chat_id,
-                            text=data['text'],
-                            parse_mode=ParseMode.MARKDOWN,
-                            reply_markup=reply_markup
-                        )
-                    success_count += 1
-                    await asyncio.sleep(0.05)  # Rate limiting
-                    
-                except Exception as e:
-                    failed_count += 1
-                    if "blocked" in str(e).lower() or "not found" in str(e).lower():
-                        self.remove_subscriber(chat_id)
-                    logger.warning(f"Failed to send broadcast to {chat_id}: {e}")
+            # Send broadcast to all subscribers in the background
+            progress_message = await query.message.reply_text("📤 Starting broadcast...")
+            progress = ProgressReporter(progress_message)
+            
+            async def run_broadcast():
+                results = await self.deliver_broadcast(data['text'], reply_markup, image=data['image'], progress=progress)
+                
+                # Show results
+                result_text = f"""
+✅ *Broadcast Sent Successfully!*
+
+📊 *Results:*
+• Successfully sent: {results['success']}
+• Failed: {results['failed']}
+• Total subscribers: {len(self.subscribers)}
+                """
+                
+                keyboard = [
+                    [InlineKeyboardButton("⬅️ Back to Settings", callback_data="settings")]
+                ]
+                
+                await query.edit_message_text(
+                    result_text,
+                    parse_mode=ParseMode.MARKDOWN,
+                    reply_markup=InlineKeyboardMarkup(keyboard)
+                )
+            
+            await self.start_campaign_job(run_broadcast(), "broadcast", progress)
+        
+        elif query.data.startswith("campaign_edit_"):
+            if not self.is_admin(user_id):
+                await query.edit_message_text("❌ Access Denied")
+                return
             
-            # Clear broadcast state
-            if user_id in self.broadcast_states:
-                del self.broadcast_states[user_id]
-            if user_id in self.temp_broadcast_data:
-                del self.temp_broadcast_data[user_id]
+            campaign_id = query.data[len("campaign_edit_"):]
+            if self.ledger.is_ambiguous(campaign_id):
+                await query.edit_message_text(AMBIGUOUS_CAMPAIGN_TEXT)
+                return
+            entry = self.ledger.campaign(campaign_id)
+            if not entry:
+                await query.edit_message_text("❌ Campaign not found.")
+                return
             
-            # Show results
-            result_text = f"""
-✅ *Broadcast Sent Successfully!*
-
-📊 *Results:*
-• Successfully sent: {success_count}
-• Failed: {failed_count}
-• Total subscribers: {len(self.subscribers)}
-            """
+            # Plain text: a cut-off excerpt of the Markdown may not parse
+            await query.edit_message_text(
+                f"✏️ Edit Sent Campaign\n\n"
+                f"Send the corrected text. It replaces the message in all "
+                f"{len(self.ledger.delivered(campaign_id))} chats that received it.\n\n"
+                f"📝 Current text:\n{entry['text'][:500]}"
+            )
+            # Armed only once the admin has seen the prompt
+            self.broadcast_states[user_id] = f'editing_sent_{campaign_id}'
+        
+        elif query.data.startswith("campaign_recall_"):
+            if not self.is_admin(user_id):
+                await query.edit_message_text("❌ Access Denied")
+                return
             
+            campaign_id = query.data[len("campaign_recall_"):]
+            if self.ledger.is_ambiguous(campaign_id):
+                await query.edit_message_text(AMBIGUOUS_CAMPAIGN_TEXT)
+                return
             keyboard = [
-                [InlineKeyboardButton("⬅️ Back to Settings", callback_data="settings")]
+                [InlineKeyboardButton("🗑️ Yes, Recall", callback_data=f"confirm_recall_{campaign_id}"),
+                 InlineKeyboardButton("❌ Cancel", callback_data="back_to_menu")]
             ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
             await query.edit_message_text(
-                result_text,
+                f"⚠️ *Recall Campaign Confirmation*\n\n"
+                f"This deletes campaign `{campaign_id}` from all "
+                f"{len(self.ledger.delivered(campaign_id))} chats that received it.\n\n"
+                f"⚠️ This action cannot be undone!",
                 parse_mode=ParseMode.MARKDOWN,
-                reply_markup=reply_markup
+                reply_markup=InlineKeyboardMarkup(keyboard)
             )
         
+        elif query.data.startswith("confirm_recall_"):
+            if not self.is_admin(user_id):
+                await query.edit_message_text("❌ Access Denied")
+                return
+            
+            campaign_id = query.data[len("confirm_recall_"):]
+            if self.ledger.is_ambiguous(campaign_id):
+                await query.edit_message_text(AMBIGUOUS_CAMPAIGN_TEXT)
+                return
+            await query.edit_message_text("🗑️ Recalling campaign...")
+            progress = ProgressReporter(query.message, "recall")
+            
+            async def run_recall():
+                results = await self.recall_campaign(campaign_id, progress)
+                await query.message.reply_text(
+                    f"✅ *Campaign Recalled!*\n\n"
+                    f"🗑️ Deleted: {results['success']}\n"
+                    f"❌ Failed: {results['failed']}"
+                    + (f"\n⏭ Skipped: {results['skipped']} (sent by a bot token no longer configured)"
+                       if results['skipped'] else ""),
+                    parse_mode=ParseMode.MARKDOWN
+                )
+            
+            await self.start_campaign_job(run_recall(), f"recall of {campaign_id}", progress)
+        
+        elif query.data.startswith(("job_pause_", "job_resume_", "job_cancel_")):
+            if not self.is_admin(user_id):
+                await query.edit_message_text("❌ Access Denied")
+                return
+            
+            _, action, job_id = query.data.split("_")
+            job = self.campaigns.get(int(job_id))
+            if not job or job.finished:
+                # Stale buttons of a campaign that already ended
+                await query.edit_message_reply_markup(reply_markup=None)
+                return
+            
+            if action == "pause":
+                job.pause()
+            elif action == "resume":
+                job.resume()
+            else:
+                job.cancel()
+            if job.progress:
+                if job.state == 'cancelled':
+                    await job.progress.finish(completed=False)
+                else:
+                    await job.progress.refresh()
+        
         # Engagement buttons
         elif query.data in ["like", "comment", "share"]:
             reactions = {
@@ -1637,21 +4587,23 @@ Type your response and send it.
     async def ask_broadcast_frequency(self, message, user_id):
         """Ask user to choose broadcast frequency"""
         data = self.temp_broadcast_data[user_id]
+        daily = Recurrence(data['rule'], data['timezone']).is_daily
         
         frequency_text = f"""
 🕰️ *Schedule Broadcast*
 
 ✅ *Time Set Successfully!*
 • Original: {data['original_time']}
-• UTC Equivalent: {data['schedule_time']}
+• Next Run (UTC): {data['schedule_time']}
 
 📅 *Choose Frequency:*
 When do you want this broadcast to be sent?
         """
         
         keyboard = [
-            [InlineKeyboardButton("📅 Today Only", callback_data="frequency_today")],
-            [InlineKeyboardButton("🔁 Daily", callback_data="frequency_daily")],
+            [InlineKeyboardButton("📅 Today Only" if daily else "📅 Next Run Only", callback_data="frequency_today")],
+            [InlineKeyboardButton("🔁 Daily" if daily else "🔁 Every Run", callback_data="frequency_daily")],
+            [InlineKeyboardButton("🌍 Repeat at Subscribers' Local Time", callback_data="frequency_local")],
             [InlineKeyboardButton("❌ Cancel", callback_data="cancel_broadcast")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -1696,8 +4648,9 @@ When do you want this broadcast to be sent?
         # Send preview with image if available
         try:
             if data['image'] and os.path.exists(data['image']):
-                with open(data['image'], 'rb') as photo:
-                    await query.edit_message_media(
+                await self.media_cache.send(
+                    data['image'],
+                    lambda photo: query.edit_message_media(
                         media=telegram.InputMediaPhoto(
                             media=photo,
                             caption=preview_text,
@@ -1705,6 +4658,7 @@ When do you want this broadcast to be sent?
                         ),
                         reply_markup=reply_markup
                     )
+                )
             else:
                 await query.edit_message_text(
                     preview_text,
@@ -1786,6 +4740,7 @@ When do you want this broadcast to be sent?
 🕰️ **Time:** {original_time}
 📝 **Message:** {broadcast['message'][:100]}{'...' if len(broadcast['message']) > 100 else ''}
 🔘 **Buttons:** {button_count}
+⏳ **Delivery:** {f"spread over {broadcast['window']:g} min" if broadcast.get('window') else 'all at once'}
 📊 **Status:** {status}
 
 **What would you like to edit?**
@@ -1796,7 +4751,8 @@ When do you want this broadcast to be sent?
              InlineKeyboardButton("📝 Edit Message", callback_data=f"edit_message_{broadcast_id}")],
             [InlineKeyboardButton("🔘 Edit Buttons", callback_data=f"edit_buttons_{broadcast_id}"),
              InlineKeyboardButton("📊 Toggle Status", callback_data=f"toggle_status_{broadcast_id}")],
-            [InlineKeyboardButton("🗑️ Delete Broadcast", callback_data=f"delete_broadcast_{broadcast_id}")],
+            [InlineKeyboardButton("⏳ Spread Delivery", callback_data=f"edit_window_{broadcast_id}"),
+             InlineKeyboardButton("🗑️ Delete Broadcast", callback_data=f"delete_broadcast_{broadcast_id}")],
             [InlineKeyboardButton("⬅️ Back to Edit List", callback_data="edit_broadcast")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -1941,8 +4897,9 @@ When do you want this broadcast to be sent?
         new_status = not old_status
         broadcast['active'] = new_status
         
-        # Save changes
+        # Save changes and start or stop its job
         self.save_scheduled_messages()
+        self.schedule_entry(broadcast)
         
         # Show confirmation
         status_text = "✅ Active" if new_status else "❌ Inactive"
@@ -2036,6 +4993,7 @@ When do you want this broadcast to be sent?
         
         # Save changes
         self.save_scheduled_messages()
+        self.unschedule_entry(broadcast_id)
         
         # Show confirmation
         original_time = broadcast.get('original_time', f"UTC {broadcast['time']}")
@@ -2117,75 +5075,27 @@ When do you want this broadcast to be sent?
                 )
         
         elif state == 'waiting_for_schedule_time':
-            # Parse timezone format: UTC+5:30 19:48 or UTC-5 14:30
+            # Parse "<timezone> <schedule>": UTC+5:30 19:48, Asia/Kolkata 19:48, Europe/Berlin mon-fri 09:00
             try:
-                # Parse input like "UTC+5:30 19:48" or "UTC+6 19:48"
-                if message_text.upper().startswith('UTC') and ' ' in message_text:
-                    timezone_part, time_part = message_text.split(' ', 1)
-                    
-                    # Parse timezone offset
-                    if '+' in timezone_part:
-                        offset_str = timezone_part.split('+')[1]
-                        offset_sign = 1
-                    elif '-' in timezone_part:
-                        offset_str = timezone_part.split('-')[1]
-                        offset_sign = -1
-                    else:
-                        offset_str = '0'
-                        offset_sign = 1
-                    
-                    # Parse offset hours and minutes
-                    if ':' in offset_str:
-                        offset_hours, offset_minutes = map(int, offset_str.split(':'))
-                    else:
-                        offset_hours = int(offset_str)
-                        offset_minutes = 0
-                    
-                    # Parse time
-                    if ':' in time_part:
-                        hour, minute = map(int, time_part.split(':'))
-                        
-                        if 0 <= hour <= 23 and 0 <= minute <= 59:
-                            # Convert user timezone to UTC
-                            # For UTC+5:30 19:27 -> UTC time = 19:27 - 5:30 = 13:57
-                            # For UTC-5 14:30 -> UTC time = 14:30 + 5 = 19:30
-                            
-                            total_offset_minutes = offset_sign * (offset_hours * 60 + offset_minutes)
-                            
-                            # Create datetime object for today at the specified time
-                            user_time = datetime.now().replace(hour=hour, minute=minute, second=0, microsecond=0)
-                            
-                            # Convert to UTC by subtracting the timezone offset
-                            utc_time = user_time - timedelta(minutes=total_offset_minutes)
-                            
-                            utc_time_str = utc_time.strftime('%H:%M')
-                            
-                            # Verification message for debugging
-                            print(f"DEBUG: {timezone_part} {time_part} -> UTC {utc_time_str}")
-                            print(f"DEBUG: Offset: {offset_sign} * ({offset_hours}h + {offset_minutes}m) = {total_offset_minutes} minutes")
-                            
-                            # Store both original and UTC times
-                            self.temp_broadcast_data[user_id]['schedule_time'] = utc_time_str
-                            self.temp_broadcast_data[user_id]['original_time'] = f"{timezone_part} {time_part}"
-                            
-                            # Ask for frequency (today only or daily)
-                            await self.ask_broadcast_frequency(update.message, user_id)
-                        else:
-                            await update.message.reply_text(
-                                "❌ Invalid time! Hour must be 0-23, minute must be 0-59."
-                            )
-                    else:
-                        await update.message.reply_text(
-                            "❌ Invalid time format in time part! Use HH:MM format."
-                        )
-                else:
-                    await update.message.reply_text(
-                        "❌ Invalid format! Please use: UTC[+/-offset] HH:MM\n\nExamples:\n• UTC+5:30 19:48\n• UTC+6 14:30\n• UTC-5 09:15"
-                    )
-            except (ValueError, IndexError) as e:
-                await update.message.reply_text(
-                    "❌ Invalid format! Please use: UTC[+/-offset] HH:MM\n\nExamples:\n• UTC+5:30 19:48\n• UTC+6 14:30\n• UTC-5 09:15"
-                )
+                recurrence = parse_schedule_input(message_text)
+            except ValueError as e:
+                await update.message.reply_text(f"❌ {e}\n\n{SCHEDULE_FORMAT_HELP}")
+                return
+            
+            next_run = recurrence.next_after(datetime.now(timezone.utc))
+            if next_run is None:
+                await update.message.reply_text("❌ This schedule never fires, please pick another one.")
+                return
+            
+            # Store the rule, its zone and the UTC time of its next run
+            data = self.temp_broadcast_data[user_id]
+            data['timezone'] = recurrence.tz_name
+            data['rule'] = recurrence.spec
+            data['schedule_time'] = next_run.strftime('%H:%M')
+            data['original_time'] = recurrence.label
+            
+            # Ask for frequency (next run only or every run)
+            await self.ask_broadcast_frequency(update.message, user_id)
         
         elif state.startswith('editing_time_'):
             # Handle editing broadcast time
@@ -2197,6 +5107,31 @@ When do you want this broadcast to be sent?
             broadcast_id = int(state.split('_')[2])
             await self.handle_edit_message(update.message, user_id, broadcast_id, message_text)
         
+        elif state.startswith('editing_window_'):
+            # Handle editing the delivery window
+            broadcast_id = int(state.split('_')[2])
+            await self.handle_edit_window(update.message, user_id, broadcast_id, message_text)
+        
+        elif state.startswith('editing_sent_'):
+            # Correct an already delivered campaign in every chat
+            campaign_id = state[len('editing_sent_'):]
+            del self.broadcast_states[user_id]
+            progress_message = await update.message.reply_text("✏️ Editing campaign in all chats...")
+            progress = ProgressReporter(progress_message, "edit")
+            
+            async def run_edit():
+                results = await self.edit_sent_campaign(campaign_id, message_text, progress)
+                await update.message.reply_text(
+                    f"✅ *Campaign Edited!*\n\n"
+                    f"✏️ Updated: {results['success']}\n"
+                    f"❌ Failed: {results['failed']}"
+                    + (f"\n⏭ Skipped: {results['skipped']} (sent by a bot token no longer configured)"
+                       if results['skipped'] else ""),
+                    parse_mode=ParseMode.MARKDOWN
+                )
+            
+            await self.start_campaign_job(run_edit(), f"edit of {campaign_id}", progress)
+        
         elif state.startswith('recreating_button_'):
             # Handle button recreation: recreating_button_X_broadcastid
             parts = state.split('_')
@@ -2291,13 +5226,15 @@ When do you want this broadcast to be sent?
         # Send preview with image if available
         try:
             if data['image'] and os.path.exists(data['image']):
-                with open(data['image'], 'rb') as photo:
-                    await update.reply_photo(
+                await self.media_cache.send(
+                    data['image'],
+                    lambda photo: update.reply_photo(
                         photo=photo,
                         caption=preview_text,
                         parse_mode=ParseMode.MARKDOWN,
                         reply_markup=reply_markup
                     )
+                )
             else:
                 await update.reply_text(
                     preview_text,
@@ -2325,71 +5262,48 @@ When do you want this broadcast to be sent?
                 keyboard.append([InlineKeyboardButton(button['text'], callback_data=button['callback_data'])])
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        # Send broadcast to all subscribers
-        success_count = 0
-        failed_count = 0
-        
-        for chat_id in self.subscribers.copy():
-            try:
-                if data['image'] and os.path.exists(data['image']):
-                    with open(data['image'], 'rb') as photo:
-                        await self.application.bot.send_photo(
-                            chat_id=chat_id,
-                            photo=photo,
-                            caption=data['text'],
-                            parse_mode=ParseMode.MARKDOWN,
-                            reply_markup=reply_markup
-                        )
-                else:
-                    await self.application.bot.send_message(
-                        chat_id=chat_id,
-                        text=data['text'],
-                        parse_mode=ParseMode.MARKDOWN,
-                        reply_markup=reply_markup
-                    )
-                success_count += 1
-                await asyncio.sleep(0.05)  # Rate limiting
-                
-            except Exception as e:
-                failed_count += 1
-                if "blocked" in str(e).lower() or "not found" in str(e).lower():
-                    self.remove_subscriber(chat_id)
-                logger.warning(f"Failed to send broadcast to {chat_id}: {e}")
-        
         # Clear broadcast state
         if user_id in self.broadcast_states:
             del self.broadcast_states[user_id]
         if user_id in self.temp_broadcast_data:
             del self.temp_broadcast_data[user_id]
         
-        # Show results
-        result_text = f"""
+        # Send broadcast to all subscribers in the background
+        progress_message = await query.message.reply_text("📤 Starting broadcast...")
+        progress = ProgressReporter(progress_message)
+        
+        async def run_broadcast():
+            results = await self.deliver_broadcast(data['text'], reply_markup, image=data['image'], progress=progress)
+            
+            # Show results
+            result_text = f"""
 ✅ *Broadcast Sent Successfully!*
 
 📊 *Results:*
-• Successfully sent: {success_count}
-• Failed: {failed_count}
+• Successfully sent: {results['success']}
+• Failed: {results['failed']}
 • Total subscribers: {len(self.subscribers)}
-        """
-        
-        keyboard = [
-            [InlineKeyboardButton("⬅️ Back to Settings", callback_data="settings")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+            """
+            
+            keyboard = [
+                [InlineKeyboardButton("⬅️ Back to Settings", callback_data="settings")]
+            ]
+            
+            try:
+                await query.edit_message_text(
+                    result_text,
+                    parse_mode=ParseMode.MARKDOWN,
+                    reply_markup=InlineKeyboardMarkup(keyboard)
+                )
+            except Exception as e:
+                # If editing fails (likely because it's an image message), send a new message
+                await query.message.reply_text(
+                    result_text,
+                    parse_mode=ParseMode.MARKDOWN,
+                    reply_markup=InlineKeyboardMarkup(keyboard)
+                )
         
-        try:
-            await query.edit_message_text(
-                result_text,
-                parse_mode=ParseMode.MARKDOWN,
-                reply_markup=reply_markup
-            )
-        except Exception as e:
-            # If editing fails (likely because it's an image message), send a new message
-            await query.message.reply_text(
-                result_text,
-                parse_mode=ParseMode.MARKDOWN,
-                reply_markup=reply_markup
-            )
+        await self.start_campaign_job(run_broadcast(), "broadcast", progress)
     
     async def schedule_broadcast(self, update, user_id):
         """Schedule broadcast for specific time"""
@@ -2398,23 +5312,23 @@ When do you want this broadcast to be sent?
         
         # Add to scheduled messages
         new_scheduled_msg = {
-            "id": len(self.scheduled_messages) + 1,
+            "id": self.next_schedule_id(),
             "time": schedule_time,
             "message": data['text'],
             "active": True,
             "type": "custom",
             "image": data['image'],
-            "buttons": data['buttons']
+            "buttons": data['buttons'],
+            "original_time": data['original_time'],
+            "timezone": data['timezone'],
+            "rule": data['rule']
         }
         
         self.scheduled_messages.append(new_scheduled_msg)
         self.save_scheduled_messages()
         
         # Add to scheduler
-        schedule.every().day.at(schedule_time).do(
-            self.run_custom_scheduled_broadcast,
-            new_scheduled_msg
-        )
+        self.schedule_entry(new_scheduled_msg)
         
         # Clear broadcast state
         if user_id in self.broadcast_states:
@@ -2422,19 +5336,13 @@ When do you want this broadcast to be sent?
         if user_id in self.temp_broadcast_data:
             del self.temp_broadcast_data[user_id]
         
-        # Calculate IST equivalent
-        utc_hour, utc_minute = map(int, schedule_time.split(':'))
-        utc_dt = datetime.now().replace(hour=utc_hour, minute=utc_minute, second=0, microsecond=0)
-        ist_dt = utc_dt + timedelta(hours=5, minutes=30)
-        ist_time = ist_dt.strftime('%H:%M')
-        
         # Show confirmation
         result_text = f"""
 ✅ *Broadcast Scheduled Successfully!*
 
 🕰️ *Schedule Details:*
-• UTC Time: {schedule_time} (Daily)
-• IST Time: {ist_time} (+5:30)
+• Schedule: {data['original_time']}
+• Next Run: {self.get_entry_next_run(new_scheduled_msg)}
 • Recipients: {len(self.subscribers)} subscribers
 • Status: Active
 
@@ -2452,79 +5360,29 @@ When do you want this broadcast to be sent?
             reply_markup=reply_markup
         )
     
-    def run_custom_scheduled_broadcast(self, scheduled_msg):
-        """Run custom scheduled broadcast"""
-        if self.application:
-            asyncio.create_task(self.send_custom_broadcast(scheduled_msg))
-    
-    async def send_custom_broadcast(self, scheduled_msg):
-        """Send custom scheduled broadcast"""
-        # Create keyboard
+    @staticmethod
+    def custom_broadcast_markup(scheduled_msg) -> InlineKeyboardMarkup:
+        """Inline keyboard of a stored broadcast's buttons"""
         keyboard = []
         for button in scheduled_msg.get('buttons', []):
             if 'url' in button:
                 keyboard.append([InlineKeyboardButton(button['text'], url=button['url'])])
             else:
                 keyboard.append([InlineKeyboardButton(button['text'], callback_data=button['callback_data'])])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        success_count = 0
-        failed_count = 0
-        
-        for chat_id in self.subscribers.copy():
-            try:
-                if scheduled_msg.get('image') and os.path.exists(scheduled_msg['image']):
-                    with open(scheduled_msg['image'], 'rb') as photo:
-                        await self.application.bot.send_photo(
-                            chat_id=chat_id,
-                            photo=photo,
-                            caption=scheduled_msg['message'],
-                            parse_mode=ParseMode.MARKDOWN,
-                            reply_markup=reply_markup
-                        )
-                else:
-                    await self.application.bot.send_message(
-                        chat_id=chat_id,
-                        text=scheduled_msg['message'],
-                        parse_mode=ParseMode.MARKDOWN,
-                        reply_markup=reply_markup
-                    )
-                success_count += 1
-                await asyncio.sleep(0.05)
-                
-            except Exception as e:
-                failed_count += 1
-                if "blocked" in str(e).lower() or "not found" in str(e).lower():
-                    self.remove_subscriber(chat_id)
-                logger.warning(f"Failed to send scheduled broadcast to {chat_id}: {e}")
-        
-        logger.info(f"Custom scheduled broadcast sent: {success_count} success, {failed_count} failed")
+        return InlineKeyboardMarkup(keyboard)
     
     async def schedule_broadcast_once(self, query, user_id):
         """Schedule broadcast for today only"""
         data = self.temp_broadcast_data[user_id]
-        schedule_time = data['schedule_time']
         original_time = data['original_time']
         
-        # Create a one-time job using UTC time
-        utc_hour = int(schedule_time.split(':')[0])
-        utc_minute = int(schedule_time.split(':')[1])
-        
-        # Get current UTC time
-        utc_now = datetime.utcnow()
-        target_datetime = utc_now.replace(
-            hour=utc_hour,
-            minute=utc_minute,
-            second=0,
-            microsecond=0
-        )
-        
-        # If the UTC time has already passed today, schedule for tomorrow
-        if target_datetime <= utc_now:
-            target_datetime += timedelta(days=1)
-            schedule_date = "Tomorrow"
-        else:
-            schedule_date = "Today"
+        # Create a one-time job for the next run of the rule (stored as naive UTC)
+        utc_now = datetime.now(timezone.utc)
+        target_datetime = Recurrence(data['rule'], data['timezone']).next_after(utc_now)
+        schedule_time = target_datetime.strftime('%H:%M')
+        days_ahead = (target_datetime.date() - utc_now.date()).days
+        schedule_date = {0: "Today", 1: "Tomorrow"}.get(days_ahead, f"In {days_ahead} days")
+        target_datetime = target_datetime.replace(tzinfo=None)
         
         print(f"DEBUG: Current UTC: {utc_now.strftime('%H:%M:%S')}")
         print(f"DEBUG: Target UTC: {target_datetime.strftime('%H:%M:%S')} ({schedule_date})")
@@ -2538,8 +5396,9 @@ When do you want this broadcast to be sent?
             "original_time": original_time
         }
         
-        # Add to one-time broadcasts list
-        self.one_time_broadcasts.append(one_time_broadcast)
+        # Store durably and register with the scheduler
+        one_time_broadcast = self.one_time_broadcasts.add(one_time_broadcast)
+        self.schedule_one_time_job(one_time_broadcast)
         print(f"DEBUG: Added one-time broadcast for {target_datetime} UTC")
         print(f"DEBUG: Total one-time broadcasts: {len(self.one_time_broadcasts)}")
         
@@ -2581,32 +5440,35 @@ When do you want this broadcast to be sent?
                 reply_markup=reply_markup
             )
     
-    async def schedule_broadcast_daily(self, query, user_id):
-        """Schedule broadcast for daily"""
+    async def schedule_broadcast_daily(self, query, user_id, local: bool = False):
+        """Schedule broadcast for daily, optionally at the time in each subscriber's own timezone"""
         data = self.temp_broadcast_data[user_id]
         schedule_time = data['schedule_time']
         original_time = data['original_time']
         
         # Add to scheduled messages
         new_scheduled_msg = {
-            "id": len(self.scheduled_messages) + 1,
+            "id": self.next_schedule_id(),
             "time": schedule_time,
             "message": data['text'],
             "active": True,
             "type": "custom",
             "image": data['image'],
             "buttons": data['buttons'],
-            "original_time": original_time
+            "original_time": original_time,
+            "timezone": data['timezone'],
+            "rule": data['rule']
         }
+        if local:
+            new_scheduled_msg['delivery'] = 'local'
+        if DELIVERY_WINDOW_MINUTES > 0:
+            new_scheduled_msg['window'] = DELIVERY_WINDOW_MINUTES
         
         self.scheduled_messages.append(new_scheduled_msg)
         self.save_scheduled_messages()
         
         # Add to scheduler
-        schedule.every().day.at(schedule_time).do(
-            self.run_custom_scheduled_broadcast,
-            new_scheduled_msg
-        )
+        self.schedule_entry(new_scheduled_msg)
         
         # Clear broadcast state
         if user_id in self.broadcast_states:
@@ -2620,9 +5482,10 @@ When do you want this broadcast to be sent?
 
 🕰️ *Schedule Details:*
 • Original Time: {original_time}
-• UTC Time: {schedule_time}
+• Next Run: {self.get_entry_next_run(new_scheduled_msg)}
 • Recipients: {len(self.subscribers)} subscribers
-• Frequency: **Daily**
+• Frequency: **{'Daily' if Recurrence(data['rule'], data['timezone']).is_daily else 'Every Run'}**
+• Delivery: {"each subscriber's local time" if local else 'everyone at once'}{self.window_label(new_scheduled_msg)}
 
 📝 The broadcast will be sent automatically every day at the scheduled time.
         """
@@ -2648,87 +5511,56 @@ When do you want this broadcast to be sent?
     async def handle_edit_time(self, message, user_id, broadcast_id, new_time_text):
         """Handle editing broadcast time"""
         try:
-            # Parse the new time using the same logic as scheduling
-            if new_time_text.upper().startswith('UTC') and ' ' in new_time_text:
-                timezone_part, time_part = new_time_text.split(' ', 1)
-                
-                # Parse timezone offset
-                if '+' in timezone_part:
-                    offset_str = timezone_part.split('+')[1]
-                    offset_sign = 1
-                elif '-' in timezone_part:
-                    offset_str = timezone_part.split('-')[1]
-                    offset_sign = -1
-                else:
-                    offset_str = '0'
-                    offset_sign = 1
-                
-                # Parse offset hours and minutes
-                if ':' in offset_str:
-                    offset_hours, offset_minutes = map(int, offset_str.split(':'))
-                else:
-                    offset_hours = int(offset_str)
-                    offset_minutes = 0
-                
-                # Parse time
-                if ':' in time_part:
-                    hour, minute = map(int, time_part.split(':'))
-                    
-                    if 0 <= hour <= 23 and 0 <= minute <= 59:
-                        # Convert to UTC
-                        total_offset_minutes = offset_sign * (offset_hours * 60 + offset_minutes)
-                        user_time = datetime.now().replace(hour=hour, minute=minute, second=0, microsecond=0)
-                        utc_time = user_time - timedelta(minutes=total_offset_minutes)
-                        utc_time_str = utc_time.strftime('%H:%M')
-                        
-                        # Find and update the broadcast
-                        for msg in self.scheduled_messages:
-                            if msg['id'] == broadcast_id:
-                                old_time = msg.get('original_time', f"UTC {msg['time']}")
-                                msg['time'] = utc_time_str
-                                msg['original_time'] = f"{timezone_part} {time_part}"
-                                break
-                        
-                        # Save changes
-                        self.save_scheduled_messages()
-                        
-                        # Clear edit state
-                        if user_id in self.broadcast_states:
-                            del self.broadcast_states[user_id]
-                        
-                        # Show confirmation
-                        result_text = f"""
+            recurrence = parse_schedule_input(new_time_text)
+            next_run = recurrence.next_after(datetime.now(timezone.utc))
+            if next_run is None:
+                raise ValueError("This schedule never fires")
+        except ValueError as e:
+            await message.reply_text(f"❌ {e}\n\n{SCHEDULE_FORMAT_HELP}")
+            return
+        
+        # Find and update the broadcast
+        broadcast = next((msg for msg in self.scheduled_messages if msg['id'] == broadcast_id), None)
+        if broadcast is None:
+            await message.reply_text("❌ Broadcast not found.")
+            return
+        
+        old_time = broadcast.get('original_time', f"UTC {broadcast['time']}")
+        broadcast['time'] = next_run.strftime('%H:%M')
+        broadcast['timezone'] = recurrence.tz_name
+        broadcast['rule'] = recurrence.spec
+        broadcast['original_time'] = recurrence.label
+        
+        # Save changes and move its job to the new time
+        self.save_scheduled_messages()
+        self.schedule_entry(broadcast)
+        
+        # Clear edit state
+        if user_id in self.broadcast_states:
+            del self.broadcast_states[user_id]
+        
+        # Show confirmation
+        result_text = f"""
 ✅ *Time Updated Successfully!*
 
 🕰️ **Old Time:** {old_time}
-🕰️ **New Time:** {timezone_part} {time_part}
-🌍 **UTC Time:** {utc_time_str}
+🕰️ **New Time:** {broadcast['original_time']}
+🌍 **Next Run:** {next_run.strftime('%Y-%m-%d %H:%M')} UTC
 
 📝 The broadcast time has been updated.
-                        """
-                        
-                        keyboard = [
-                            [InlineKeyboardButton("✏️ Edit More", callback_data=f"edit_broadcast_{broadcast_id}")],
-                            [InlineKeyboardButton("⬅️ Back to Settings", callback_data="settings")]
-                        ]
-                        reply_markup = InlineKeyboardMarkup(keyboard)
-                        
-                        await message.reply_text(
-                            result_text,
-                            parse_mode=ParseMode.MARKDOWN,
-                            reply_markup=reply_markup
-                        )
-                        return
-            
-            # Invalid format
-            await message.reply_text(
-                "❌ Invalid format! Please use: UTC[+/-offset] HH:MM\n\nExamples:\n• UTC+5:30 19:48\n• UTC+6 14:30\n• UTC-5 09:15"
-            )
-            
-        except Exception as e:
-            await message.reply_text(
-                "❌ Invalid time format! Please use: UTC[+/-offset] HH:MM\n\nExamples:\n• UTC+5:30 19:48\n• UTC+6 14:30\n• UTC-5 09:15"
-            )
+        """
+        
+        keyboard = [
+            [InlineKeyboardButton("✏️ Edit More", callback_data=f"edit_broadcast_{broadcast_id}")],
+            [InlineKeyboardButton("⬅️ Back to Settings", callback_data="settings")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        await message.reply_text(
+            result_text,
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=reply_markup
+        )
     
     async def handle_edit_message(self, message, user_id, broadcast_id, new_message):
         """Handle editing broadcast message"""
@@ -2779,6 +5611,54 @@ When do you want this broadcast to be sent?
             reply_markup=reply_markup
         )
     
+    async def handle_edit_window(self, message, user_id, broadcast_id, window_text):
+        """Handle editing the minutes a broadcast's delivery is spread over"""
+        try:
+            window = float(window_text.strip())
+        except ValueError:
+            window = -1
+        if not 0 <= window <= 24 * 60:
+            await message.reply_text("❌ Enter a number of minutes between 0 and 1440.")
+            return
+        
+        broadcast = next((msg for msg in self.scheduled_messages if msg['id'] == broadcast_id), None)
+        if not broadcast:
+            await message.reply_text("❌ Broadcast not found.")
+            return
+        
+        if window:
+            broadcast['window'] = window
+        else:
+            broadcast.pop('window', None)
+        self.save_scheduled_messages()
+        
+        # Clear edit state
+        if user_id in self.broadcast_states:
+            del self.broadcast_states[user_id]
+        
+        if window:
+            rate = len(self.subscribers) / (window * 60)
+            details = f"Each run is spread over {window:g} minutes (about {rate:.1f} messages/second now)."
+        else:
+            details = "Each run is sent as fast as the rate limit allows."
+        result_text = f"""
+✅ *Delivery Updated!*
+
+⏳ {details}
+        """
+        
+        keyboard = [
+            [InlineKeyboardButton("✏️ Edit More", callback_data=f"edit_broadcast_{broadcast_id}")],
+            [InlineKeyboardButton("⬅️ Back to Settings", callback_data="settings")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        await message.reply_text(
+            result_text,
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=reply_markup
+        )
+    
     async def show_edit_buttons_options(self, query, user_id, broadcast_id):
         """Show button editing options"""
         # Find the broadcast
@@ -3229,9 +6109,76 @@ Type your response and send it.
         
         await update.message.reply_text(message)
     
+    async def timezone_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /timezone command: pick the timezone local-time broadcasts use for this chat"""
+        chat_id = update.effective_chat.id
+        
+        if not context.args:
+            current = self.subscriber_timezones.get(chat_id)
+            await update.message.reply_text(
+                f"🌍 Your timezone: {current or 'not set'}\n\n"
+                "Set it to get scheduled updates at your local time:\n"
+                "/timezone Europe/Berlin\n"
+                "/timezone UTC+5:30\n\n"
+                "/timezone off - Go back to the default schedule"
+            )
+            return
+        
+        if chat_id not in self.subscribers:
+            await update.message.reply_text("You aren't subscribed to broadcasts.\n\nSend /start to subscribe first!")
+            return
+        
+        zone = context.args[0]
+        if zone.lower() == 'off':
+            zone = None
+        else:
+            try:
+                zone = canonical_timezone(zone)
+            except ValueError as e:
+                await update.message.reply_text(f"❌ {e}\n\nUse a name like Asia/Kolkata or an offset like UTC+5:30.")
+                return
+        
+        new_zone = zone is not None and zone not in self.picked_timezones()
+        if zone is None:
+            self.subscriber_timezones.pop(chat_id, None)
+        else:
+            self.subscriber_timezones[chat_id] = zone
+        self.storage.save_subscriber_timezone(chat_id, zone)
+        
+        # A zone nobody had before needs its own run of every local-time schedule
+        if new_zone:
+            for msg in self.scheduled_messages:
+                if msg.get('delivery') == 'local':
+                    self.schedule_entry(msg)
+        
+        await update.message.reply_text(
+            f"✅ Timezone set to {zone}" if zone else "✅ Timezone cleared, you'll get broadcasts on the default schedule"
+        )
+    
+    async def post_init(self, application: Application):
+        """Start the scheduler and resume interrupted campaigns once the event loop is running"""
+        self.scheduler.start()
+        for checkpoint in self.campaign_store.unfinished():
+            self.campaigns.submit(self.resume_campaign(checkpoint), name=f"campaign {checkpoint.campaign_id}")
+    
+    async def post_shutdown(self, application: Application):
+        """Flush state to disk when the bot stops"""
+        await self.scheduler.stop()
+        if self.sharded_broadcaster:
+            self.sharded_broadcaster.shutdown()
+        self.pending_removals.flush()
+        self.save_subscribers()
+    
     def run(self):
         """Run the bot with scheduler"""
-        self.application = Application.builder().token(self.bot_token).build()
+        self.application = (
+            Application.builder()
+            .token(self.bot_token)
+            .rate_limiter(self.rate_limiter)
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+            .build()
+        )
         
         # Add handlers
         self.application.add_handler(CommandHandler("start", self.start_command))
@@ -3240,6 +6187,9 @@ Type your response and send it.
         self.application.add_handler(CommandHandler("broadcast", self.broadcast_command))
         self.application.add_handler(CommandHandler("addschedule", self.add_schedule_command))
         self.application.add_handler(CommandHandler("stats", self.stats_command))
+        self.application.add_handler(CommandHandler("campaigns", self.campaigns_command))
+        self.application.add_handler(CommandHandler("jobs", self.jobs_command))
+        self.application.add_handler(CommandHandler("timezone", self.timezone_command))
         self.application.add_handler(CommandHandler("help", self.help_command))
         
         # Add callback query handler for buttons
@@ -3248,13 +6198,9 @@ Type your response and send it.
         # Add message handler for broadcast creation
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_broadcast_creation_message))
         
-        # Setup scheduler
+        # Setup scheduler (started on the application's event loop in post_init)
         self.setup_scheduler()
         
-        # Start scheduler in background thread
-        scheduler_thread = threading.Thread(target=self.run_scheduler, daemon=True)
-        scheduler_thread.start()
-        
         logger.info("Scheduled Broadcast Bot started successfully!")
         print("🤖 Scheduled Telegram Broadcast Bot is running...")
         print(f"👥 Current subscribers: {len(self.subscribers)}")
@@ -3266,13 +6212,5 @@ Type your response and send it.
         self.application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == "__main__":
-    # Install schedule if not available
-    try:
-        import schedule
-    except ImportError:
-        print("Installing schedule package...")
-        os.system('pip install schedule')
-        import schedule
-    
     bot = ScheduledTelegramBot()
     bot.run()
\ No newline at end of file